@@ -0,0 +1,104 @@
+"""
+Compare the generic and the generated cbor encoders and decoders.
+
+This decodes and re-encodes all the "module" documents of the current ingest
+directory (e.g. after ``papyri ingest ~/.papyri/data/numpy_<version>``) with:
+
+ - ``generic``: `Node.cbor` and `Node._from_values`, which go through the
+   per-class field registry,
+ - ``generated``: the functions generated for each class by
+   `papyri.common_ast.register`, used by `papyri.take2.encoder`.
+
+Both must give the same bytes.
+
+Documents are stored in the sectioned layout, and decoded lazily, so this also
+compares decoding a document and touching all its fields with only touching
+``example_section_data``, as the gallery does.
+
+Usage::
+
+    $ python benchmarks/codec.py [--repeat N] [--package numpy]
+
+"""
+import argparse
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+from papyri.common_ast import DECODERS, ENCODERS, TAG_MAP, fields
+from papyri.config import ingest_dir
+from papyri.crosslink import IngestedBlobs, LazyIngestedBlob, encoder
+from papyri.graphstore import GraphStore
+
+
+@contextmanager
+def generic():
+    """
+    Disable the generated functions, except the ones of the sectioned layout,
+    so that `encoder` falls back to `Node.cbor` and `Node._from_values`.
+    """
+    saved = dict(ENCODERS), dict(DECODERS)
+    for type_ in set(ENCODERS) - {IngestedBlobs, LazyIngestedBlob}:
+        del ENCODERS[type_]
+    for tag in set(DECODERS) - {TAG_MAP[LazyIngestedBlob]}:
+        del DECODERS[tag]
+    try:
+        yield
+    finally:
+        ENCODERS.update(saved[0])
+        DECODERS.update(saved[1])
+
+
+def decode_all(data):
+    """
+    Decode a document, and all of its lazily decoded fields and sections.
+    """
+    doc = encoder.decode(data)
+    for name in fields(IngestedBlobs).names:
+        getattr(doc, name)
+    list(doc.content.values())
+    return doc
+
+
+def _best(f, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        now = perf_counter()
+        res = [f(x) for x in items]
+        best = min(best, perf_counter() - now)
+    return best, res
+
+
+def main(repeat, package):
+    store = GraphStore(ingest_dir)
+    keys = store.glob((package, None, "module", None))
+    datas = [store.get(k) for k in keys]
+    size = sum(len(d) for d in datas) / 1024 / 1024
+    print(f"{len(keys)} documents, {size:0.1f} MiB, from {ingest_dir}")
+
+    for label, context in [("generic", generic), ("generated", nullcontext)]:
+        with context():
+            d, objs = _best(decode_all, datas, repeat)
+            e, encoded = _best(encoder.encode, objs, repeat)
+        assert encoded == datas, label
+        # don't let the objects of one run slow the garbage collection of the
+        # next one.
+        del objs, encoded
+        print(
+            f"{label:>10}: decode {d:0.3f}s ({size / d:5.1f} MiB/s),"
+            f" encode {e:0.3f}s ({size / e:5.1f} MiB/s)"
+        )
+
+    def touch_examples(data):
+        encoder.decode(data).example_section_data
+
+    full, _ = _best(decode_all, datas, repeat)
+    examples, _ = _best(touch_examples, datas, repeat)
+    print(f"lazy: all fields {full:0.3f}s, example_section_data only {examples:0.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--package", default=None)
+    args = parser.parse_args()
+    main(args.repeat, args.package)
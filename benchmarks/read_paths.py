@@ -0,0 +1,77 @@
+"""
+Compare the ways of reading ingested documents back for rendering.
+
+This copies the "module" documents of the current ingest directory into a
+temporary `FileStore` and `PackStore`, and times reading and decoding all of
+them, the way ``papyri render`` does:
+
+ - ``files``: one ``read_bytes()`` per document,
+ - ``pack-read``: ``seek`` + ``read`` in the pack segment (a copy),
+ - ``pack-mmap``: a ``memoryview`` slice of the mapped segment (no copy).
+
+Usage::
+
+    $ python benchmarks/read_paths.py [--repeat N]
+
+"""
+import argparse
+import sqlite3
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from papyri.config import ingest_dir
+from papyri.crosslink import encoder
+from papyri.graphstore import FileStore, GraphStore
+from papyri.packstore import PackStore
+
+
+def _best(keys, f, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        now = perf_counter()
+        for k in keys:
+            f(k)
+        best = min(best, perf_counter() - now)
+    return best
+
+
+def _time(label, keys, read, repeat):
+    r = _best(keys, read, repeat)
+    d = _best(keys, lambda k: encoder.decode(read(k)), repeat)
+    n = len(keys)
+    print(
+        f"{label:>10}: read {r / n * 1e6:6.1f}us/doc,"
+        f" read+decode {d / n * 1e6:6.1f}us/doc ({d:0.3f}s total)"
+    )
+
+
+def main(repeat):
+    source = GraphStore(ingest_dir)
+    keys = source.glob((None, None, "module", None))
+    print(f"{len(keys)} documents from {ingest_dir}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = FileStore(Path(tmp) / "files")
+        pack = PackStore(Path(tmp) / "packs", sqlite3.connect(":memory:"))
+        for k in keys:
+            data = source.get(k)
+            files.put(k, data)
+            pack.put(k, data)
+
+        def pack_read(key):
+            segment, start, length = pack._locate(key)
+            path = pack._segment_path(key.module, key.version, segment)
+            with path.open("rb") as f:
+                f.seek(start)
+                return f.read(length)
+
+        _time("files", keys, files.get, repeat)
+        _time("pack-read", keys, pack_read, repeat)
+        _time("pack-mmap", keys, pack.get_view, repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args().repeat)
@@ -243,6 +243,15 @@ def ingest(
     check: bool = False,
     relink: bool = False,
     dummy_progress: bool = typer.Option(False, help="Disable rich progress bar"),
+    pack: bool = typer.Option(
+        False, help="Store ingested documents in pack files instead of one file each"
+    ),
+    validation_level: str = typer.Option(
+        "full", help="Which documents to type check: off, sample or full"
+    ),
+    compact: bool = typer.Option(
+        True, help="Reclaim the space of overwritten documents in pack files"
+    ),
 ):
     """
     Given paths to a docbundle folder, ingest it into the known libraries.
@@ -258,14 +267,32 @@ def ingest(
         <Multiline Description Here>
     dummy_progress : bool
         <Multiline Description Here>
+    pack : bool
+        store the documents in a few pack files per package instead of one file
+        per document. Once used, the ingest directory keeps using pack files.
+    validation_level : {"off", "sample", "full"}
+        type check all the documents before writing them, about one in ten,
+        or none.
+    compact : bool
+        once done, rewrite the pack files that are mostly overwritten
+        documents. Running ``papyri serve`` processes look the documents of
+        those files up again.
     """
     _intro()
     from . import crosslink as cr
 
     for p in paths:
-        cr.main(Path(p), check, dummy_progress=dummy_progress)
+        cr.main(
+            Path(p),
+            check,
+            dummy_progress=dummy_progress,
+            storage="pack" if pack else None,
+            validation_level=validation_level,
+        )
     if relink:
         cr.relink(dummy_progress=dummy_progress)
+    if compact:
+        cr.compact(dummy_progress=dummy_progress)
 
 
 ROOT = "https://pydocs.github.io/pkg"
@@ -390,6 +417,9 @@ def install(
 @app.command()
 def relink(
     dummy_progress: bool = typer.Option(False, help="Disable rich progress bar"),
+    reindex: bool = typer.Option(
+        False, help="Rebuild the documents index from the stored files first"
+    ),
 ):
     """
     Rescan all the documentation to find potential new crosslinks.
@@ -397,7 +427,7 @@ def relink(
     _intro()
     from . import crosslink as cr
 
-    cr.relink(dummy_progress=dummy_progress)
+    cr.relink(dummy_progress=dummy_progress, reindex=reindex)
 
 
 @app.command()
@@ -421,6 +451,15 @@ def gen(
         False, help="Overwrite fail on unseen error option"
     ),
     only: List[str] = typer.Option(None, "--only"),
+    validation_level: Optional[str] = typer.Option(
+        None, help="Which documents to type check: off, sample or full"
+    ),
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", help="Number of processes documenting the API"
+    ),
+    cache: bool = typer.Option(
+        True, help="Reuse the documents of unchanged objects from previous runs"
+    ),
 ):
     """
     Generate documentation for a given package.
@@ -457,6 +496,9 @@ def gen(
             fail_early=fail_early,
             fail_unseen_error=fail_unseen_error,
             limit_to=only,
+            validation_level=validation_level,
+            jobs=jobs,
+            cache=cache,
         )
 
 
@@ -499,11 +541,21 @@ def ascii(name: str):
 
 
 @app.command()
-def serve(sidebar: bool = True, port: int = 1234):
+def serve(
+    sidebar: bool = True,
+    port: int = 1234,
+    cache_size: Optional[int] = typer.Option(
+        None, help="Size of the decoded documents cache in MiB, 0 to disable"
+    ),
+):
     _intro()
     from .render import serve as s2
 
-    s2(sidebar=sidebar, port=port)
+    s2(
+        sidebar=sidebar,
+        port=port,
+        cache_size=None if cache_size is None else cache_size * 1024 * 1024,
+    )
 
 
 @app.command()
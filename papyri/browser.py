@@ -23,6 +23,7 @@
 Urwid tour.  Shows many of the standard widget types and features.
 """
 import sys
+from pathlib import Path
 from typing import List
 
 import urwid
@@ -210,6 +211,7 @@ class TextWithLink(urwid.Text):
 
 blank = urwid.Divider()
 from papyri.config import ingest_dir
+from papyri.graphstore import GraphStore
 
 
 def dedup(l):
@@ -229,8 +231,8 @@ def dedup(l):
     return acc
 
 
-def load(file_path, walk, qa, gen_content, frame):
-    blob = encoder.decode(file_path.read_bytes())
+def load(key, walk, qa, gen_content, frame):
+    blob = encoder.decode(GraphStore(ingest_dir).get(key))
     assert hasattr(blob, "arbitrary")
     for i in gen_content(blob, frame):
         walk.append(i)
@@ -239,7 +241,7 @@ def load(file_path, walk, qa, gen_content, frame):
 def guess_load(rough, walk, gen_content, stack, frame):
     stack.append(rough)
 
-    candidates = list(ingest_dir.glob(f"*/*/module/{rough}"))
+    candidates = GraphStore(ingest_dir).glob((None, None, "module", rough))
     if candidates:
         for _q in range(len(walk)):
             walk.pop()
@@ -443,8 +445,13 @@ class Renderer:
 
     def render_Fig(self, fig):
         def show_fig(name):
-            cand = next(ingest_dir.glob(f"*/*/assets/{name}"))
             import subprocess
+            import tempfile
+
+            store = GraphStore(ingest_dir)
+            [key, *_] = store.glob((None, None, "assets", name))
+            cand = Path(tempfile.mkdtemp()) / name
+            cand.write_bytes(store.get(key))
 
             subprocess.Popen(
                 ["qlmanage", "-p", cand],
@@ -477,35 +484,33 @@ class Renderer:
         )
 
     def render_Code2(self, code):
-        # entries/out/ce_status
+        # value/spans/classes/references/out/ce_status
 
-        def insert_prompt(entries):
+        def insert_prompt(code):
             yield (
                 "verbatim",
                 ">>>",
                 # lambda: self.cb("likely copy content to clipboard"),
             )
             yield (None, " ")
-            for e in entries:
-                type_ = e.type
-                maybe_link = e.link
-                if maybe_link.__class__.__name__ == "Link":
-                    assert isinstance(maybe_link.reference, RefInfo)
+            for text, type_, reference in code.tokens():
+                if reference is not None:
+                    assert isinstance(reference, RefInfo)
                     yield Link(
                         "pyg-" + str(type_),
-                        maybe_link.value,
-                        (lambda m: (lambda: self.cb(m.reference)))(maybe_link),
+                        text,
+                        (lambda r: (lambda: self.cb(r)))(reference),
                     )
                 else:
-                    if maybe_link == "\n":
+                    if text == "\n":
                         yield (None, "\n")
                         yield ("verbatim", "... ")
                     else:
-                        yield ("pyg-" + str(type_), f"{maybe_link}")
+                        yield ("pyg-" + str(type_), f"{text}")
 
         return urwid.Padding(
             urwid.Pile(
-                [TextWithLink([x for x in insert_prompt(code.entries)])]
+                [TextWithLink([x for x in insert_prompt(code)])]
                 + ([Text(code.out)] if code.out else []),
             ),
             left=2,
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import json
 import typing
-from typing import Dict, Any
+import zlib
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
 
 import cbor2
 
@@ -11,6 +12,8 @@ from .myst_serialiser import serialize as myst_serialize
 
 
 class Base:
+    __slots__ = ()
+
     def validate(self):
         validate(self)
         return self
@@ -20,29 +23,96 @@ class Base:
         return cls()
 
 
-class Node(Base):
+class NodeMeta(type):
+    """
+    Metaclass of `Node`, giving each subclass ``__slots__`` for the fields it
+    annotates, so that instances do not carry a ``__dict__``.
+
+    Classes that define ``__slots__`` themselves are left as is. Annotated
+    class attributes (default values) would conflict with the slots, they are
+    moved to ``_defaults``, and assigned to instances by `Node.__init__`.
+    """
+
+    def __new__(mcls, name, bases, namespace, **kwargs):
+        if "__slots__" not in namespace:
+            inherited = {
+                slot
+                for base in bases
+                for klass in base.__mro__
+                for slot in klass.__dict__.get("__slots__", ())
+            }
+            defaults: Dict[str, Any] = {}
+            for base in reversed(bases):
+                defaults.update(getattr(base, "_defaults", {}))
+            annotations = namespace.get("__annotations__", {})
+            for attr in annotations:
+                if attr in namespace:
+                    defaults[attr] = namespace.pop(attr)
+            namespace["__slots__"] = tuple(a for a in annotations if a not in inherited)
+            namespace["_defaults"] = defaults
+        return super().__new__(mcls, name, bases, namespace, **kwargs)
+
+
+class Node(Base, metaclass=NodeMeta):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
-        tt = get_type_hints(type(self))
-        if type(self).__name__ == "MMystDirective":
-            tt = {k: v for k, v in tt.items() if k != "type"}
-        for attr, val in zip(tt, args):
+        info = fields(type(self))
+        for attr, val in info.defaults.items():
+            setattr(self, attr, val)
+        for attr, val in zip(info.names, args):
             setattr(self, attr, val)
         for k, v in kwargs.items():
-            assert k in tt
+            assert k in info.hints
             setattr(self, k, v)
-        if hasattr(self, "_post_deserialise"):
+        if info.post_deserialise:
+            self._post_deserialise()
+
+    @classmethod
+    def _from_values(cls, values):
+        """
+        Build an instance from the values of its fields, in order, as stored
+        in cbor.
+
+        Classes using `Node.__init__` are built with plain attribute
+        assignment, the others through their constructor.
+
+        This is the generic version of the decoders generated by `register`,
+        used when the number of values does not match the fields.
+        """
+        info = fields(cls)
+        if not info.plain:
+            return cls(**dict(zip(info.names, values)))
+        self = cls.__new__(cls)
+        for attr, val in info.defaults.items():
+            setattr(self, attr, val)
+        for attr, val in zip(info.names, values):
+            setattr(self, attr, val)
+        if info.post_deserialise:
             self._post_deserialise()
+        return self
 
     def cbor(self, encoder):
-        tag = TAG_MAP[type(self)]
-        attrs = get_type_hints(type(self))
-        encoder.encode(cbor2.CBORTag(tag, [getattr(self, k) for k in attrs]))
+        """
+        Generic encoding, see `ENCODERS` for the specialized ones.
+        """
+        info = fields(type(self))
+        encoder.encode(cbor2.CBORTag(info.tag, [getattr(self, k) for k in info.names]))
+
+    def __setstate__(self, state):
+        # unpickling, the state of slotted instances is (None, {slot: value});
+        # bypass __setattr__, which frozen dataclasses forbid.
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for attr, val in state.items():
+            object.__setattr__(self, attr, val)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not (type(self) == type(other)):
             return False
-        tt = get_type_hints(type(self))
-        for attr in tt:
+        for attr in fields(type(self)).names:
             a, b = getattr(self, attr), getattr(other, attr)
             if a != b:
                 return False
@@ -50,9 +120,8 @@ class Node(Base):
         return True
 
     def __repr__(self):
-        tt = get_type_hints(type(self))
         acc = ""
-        for t in tt:
+        for t in fields(type(self)).names:
             acc += f"{t}: {getattr(self, t)!r}\n"
 
         return f"<{self.__class__.__name__}: \n{indent(acc)}>"
@@ -73,18 +142,88 @@ class Node(Base):
 
     def __hash__(self):
         return hash(
-            tuple(
-                tuple(getattr(self, x))
-                for x in dir(self)
-                if not x.startswith("_") and not callable(getattr(self, x))
+            (
+                type(self),
+                *[_hash_value(getattr(self, k)) for k in fields(type(self)).names],
             )
         )
 
 
+def _hash_value(value) -> int:
+    """
+    Hash a field value, consistently with `Node.__eq__`, which compares them
+    with ``==``.
+    """
+    if isinstance(value, (list, tuple)):
+        return hash(tuple([_hash_value(v) for v in value]))
+    if isinstance(value, dict):
+        return hash(frozenset([(k, _hash_value(v)) for k, v in value.items()]))
+    return hash(value)
+
+
 TAG_MAP: Dict[Any, int] = {}
 REV_TAG_MAP: Dict[int, Any] = {}
 
 
+class Fields(NamedTuple):
+    """
+    What the hot paths (construction, encoding, decoding, comparison and
+    validation) need to know about the fields of a Node subclass.
+    """
+
+    #: field names, in the order of the annotations, which is also the
+    #: order of the values in cbor.
+    names: Tuple[str, ...]
+    #: field name -> resolved annotation.
+    hints: Dict[str, Any]
+    #: cbor tag, None if the class is not registered.
+    tag: Optional[int]
+    #: whether the class uses `Node.__init__`, and can thus be built by
+    #: assigning attributes on a bare instance.
+    plain: bool
+    #: whether the class defines `_post_deserialise`.
+    post_deserialise: bool
+    #: field name -> default value, for the annotated class attributes, see
+    #: `NodeMeta`.
+    defaults: Dict[str, Any]
+
+
+# type -> Fields, never evicted, see `fields`.
+FIELDS: Dict[type, Fields] = {}
+
+# Specialized encoding and decoding functions for each registered class,
+# generated by `register`: type -> encode(encoder, obj), tag -> decode(values).
+ENCODERS: Dict[type, Callable[[Any, Any], None]] = {}
+DECODERS: Dict[int, Callable[[Any], Any]] = {}
+
+# type -> validator(obj), returning a description of the first invalid field,
+# generated by `_validator`.
+VALIDATORS: Dict[type, Callable[[Any], Optional[str]]] = {}
+
+
+def fields(type_) -> Fields:
+    """
+    Get the `Fields` of ``type_``.
+
+    They are computed on first use, and not in `register`, as annotations may
+    refer to classes defined later in the same module; then stored for good,
+    as resolving annotations with `typing.get_type_hints` is slow.
+    """
+    info = FIELDS.get(type_)
+    if info is None:
+        hints = get_type_hints(type_)
+        info = Fields(
+            names=tuple(hints),
+            hints=hints,
+            tag=TAG_MAP.get(type_),
+            plain=type_.__init__ is Node.__init__,
+            post_deserialise=hasattr(type_, "_post_deserialise"),
+            defaults=getattr(type_, "_defaults", {}),
+        )
+        FIELDS[type_] = info
+    return info
+
+
 def indent(text, marker="   |"):
     """
     Return the given text indented with 3 space plus a pipe for display.
@@ -96,32 +235,120 @@ def indent(text, marker="   |"):
 def _invalidate(obj, depth=0):
     """
     Recursively validate type anotated classes.
+
+    Return a description of the first field with a wrong type, if any.
     """
+    return (VALIDATORS.get(type(obj)) or _validator(type(obj)))(obj)
 
-    annotations = get_type_hints(type(obj))
-    for k, v in annotations.items():
-        # FIX: AttributeError: 'MText' object has no attribute 'position'
-        item = getattr(obj, k)
-        res = not_type_check(item, v)
-        if res:
-            return f"{k} field of  {type(obj)} : {res}"
 
-        if isinstance(item, (list, tuple)):
-            for ii, i in enumerate(item):
-                sub = _invalidate(i, depth + 1)
-                if sub is not None:
-                    return f"{k}.{ii}." + sub
-        if isinstance(item, dict):
-            for ii, i in item.items():
-                sub = _invalidate(i, depth + 1)
+def _no_fields(obj) -> Optional[str]:
+    return None
+
+
+def _validator(type_) -> Callable[[Any], Optional[str]]:
+    """
+    Get the validator of ``type_``, used by `_invalidate`.
+
+    It checks each field against its annotation with the functions compiled
+    by `_type_checker`, then recurses in the field values (and items of lists
+    and dicts) with the validators of their own types. Validators are
+    compiled on first use, like `fields`, and stored in `VALIDATORS`.
+    """
+    cached = VALIDATORS.get(type_)
+    if cached is not None:
+        return cached
+    checks = [(k, _type_checker(v)) for k, v in fields(type_).hints.items()]
+    if not checks:
+        VALIDATORS[type_] = _no_fields
+        return _no_fields
+
+    def validator(obj):
+        for k, check in checks:
+            # FIX: AttributeError: 'MText' object has no attribute 'position'
+            item = getattr(obj, k)
+            res = check(item)
+            if res:
+                return f"{k} field of  {type(obj)} : {res}"
+
+            if isinstance(item, (list, tuple)):
+                for ii, i in enumerate(item):
+                    sub = _invalidate(i)
+                    if sub is not None:
+                        return f"{k}.{ii}." + sub
+            elif isinstance(item, dict):
+                for ii, i in item.items():
+                    sub = _invalidate(i)
+                    if sub is not None:
+                        return f"{k}.{ii}." + sub
+            else:
+                sub = _invalidate(item)
                 if sub is not None:
-                    return f"{k}.{ii}." + sub
-        else:
-            sub = _invalidate(item, depth + 1)
-            if sub is not None:
-                return f"{k}.{sub}." + sub
+                    return f"{k}.{sub}." + sub
+        return None
+
+    VALIDATORS[type_] = validator
+    return validator
 
-    # return outcome,s
+
+def _type_checker(annotation) -> Callable[[Any], Optional[str]]:
+    """
+    Compile ``annotation`` into a function equivalent to
+    ``lambda item: not_type_check(item, annotation)``.
+
+    Unions of classes become a single `isinstance` call with a tuple of the
+    classes; annotations that are not handled here fall back to
+    `not_type_check`.
+    """
+    origin = getattr(annotation, "__origin__", None)
+    args: Tuple[Any, ...] = getattr(annotation, "__args__", ())
+    if origin is None and isinstance(annotation, type):
+
+        def check(item):
+            if isinstance(item, annotation):
+                return None
+            return f"expecting {annotation} got {type(item)}"
+
+    elif origin is typing.Union:
+        classes = tuple(a for a in args if isinstance(a, type))
+        others = [_type_checker(a) for a in args if not isinstance(a, type)]
+
+        def check(item):
+            if isinstance(item, classes) or any(c(item) is None for c in others):
+                return None
+            return f"expecting one of {annotation!r}, got {item!r}"
+
+    elif origin in (list, tuple) and len(args) == 1:
+        inner = _type_checker(args[0])
+
+        def check(item):
+            if not isinstance(item, (list, tuple)):
+                return f"got  {type(item)}, Yexpecting list"
+            for i in item:
+                res = inner(i)
+                if res is not None:
+                    return res
+            return None
+
+    elif origin is dict:
+        key_check, value_check = _type_checker(args[0]), _type_checker(args[1])
+
+        def check(item):
+            if not isinstance(item, dict):
+                return f"got  {type(item)}, Yexpecting list"
+            if any(key_check(k) is not None for k in item):
+                return ":invalid key type {ax[0]}"
+            for v in item.values():
+                res = value_check(v)
+                if res is not None:
+                    return res
+            return None
+
+    else:
+
+        def check(item):
+            return not_type_check(item, annotation)
+
+    return check
 
 
 def validate(obj):
@@ -130,6 +357,41 @@ def validate(obj):
         raise ValueError(f"Wrong type at field :: {res}")
 
 
+#: accepted values of the ``validation_level`` option of gen and ingest, see
+#: `should_validate`.
+VALIDATION_LEVELS = ("off", "sample", "full")
+
+# with validation_level="sample", validate one document in _SAMPLE_RATE.
+_SAMPLE_RATE = 10
+
+
+def check_validation_level(level: str) -> str:
+    """
+    Return ``level``, raising a ValueError if it is not one of `VALIDATION_LEVELS`.
+    """
+    if level not in VALIDATION_LEVELS:
+        raise ValueError(
+            f"validation_level must be one of {VALIDATION_LEVELS}, not {level!r}"
+        )
+    return level
+
+
+def should_validate(level: str, name: str) -> bool:
+    """
+    Whether to validate the document ``name`` at the given validation level:
+
+     - ``"full"``: all documents,
+     - ``"sample"``: about one document in ten, always the same ones,
+     - ``"off"``: none.
+    """
+    if level == "full":
+        return True
+    if level == "sample":
+        return zlib.crc32(name.encode()) % _SAMPLE_RATE == 0
+    check_validation_level(level)
+    return False
+
+
 def not_type_check(item, annotation):
     if not hasattr(annotation, "__origin__"):
         if isinstance(item, annotation):
@@ -172,6 +434,53 @@ def not_type_check(item, annotation):
     raise ValueError(item, annotation)
 
 
+def _field_names(type_) -> Tuple[str, ...]:
+    """
+    Names of the annotated fields of ``type_``, in the same order as
+    `typing.get_type_hints`, but without evaluating the annotations, which may
+    refer to classes that are not defined yet.
+    """
+    names: Dict[str, None] = {}
+    for base in reversed(type_.__mro__):
+        names.update(dict.fromkeys(base.__dict__.get("__annotations__", {})))
+    return tuple(names)
+
+
+def _compile_codec(type_, tag: int):
+    """
+    Generate the encoding and decoding functions of ``type_``.
+
+    The encoder writes the tag and array headers then each field, which gives
+    the same bytes as `Node.cbor`, without building a list and a `CBORTag`.
+    The decoder assigns each field from its position (or passes them all
+    positionally to the constructor of classes with their own ``__init__``),
+    and falls back to `Node._from_values` if the number of values differs.
+    """
+    names = _field_names(type_)
+    n = len(names)
+    lines = [
+        "def encode(encoder, obj):",
+        f"    encoder.encode_length(6, {tag})",
+        f"    encoder.encode_length(4, {n})",
+        *[f"    encoder.encode(obj.{name})" for name in names],
+        "",
+        "def decode(values):",
+        f"    if len(values) != {n}:",
+        "        return cls._from_values(values)",
+    ]
+    if type_.__init__ is Node.__init__:
+        lines.append("    obj = new(cls)")
+        lines += [f"    obj.{name} = values[{i}]" for i, name in enumerate(names)]
+        if hasattr(type_, "_post_deserialise"):
+            lines.append("    obj._post_deserialise()")
+        lines.append("    return obj")
+    else:
+        lines.append("    return cls(*values)")
+    namespace: Dict[str, Any] = {"cls": type_, "new": object.__new__}
+    exec("\n".join(lines), namespace)
+    return namespace["encode"], namespace["decode"]
+
+
 def register(value):
     assert value not in REV_TAG_MAP, REV_TAG_MAP[value]
 
@@ -179,6 +488,10 @@ def register(value):
         assert type_ not in TAG_MAP
         TAG_MAP[type_] = value
         REV_TAG_MAP[value] = type_
+        FIELDS.pop(type_, None)
+        VALIDATORS.pop(type_, None)
+        if isinstance(type_, type):
+            ENCODERS[type_], DECODERS[value] = _compile_codec(type_, value)
 
         return type_
 
@@ -1,15 +1,21 @@
+import os
 from os.path import expanduser
 from pathlib import Path
 
-base_dir = Path(expanduser("~/.papyri/"))
+# These can be overridden from the environment, for example to ingest and
+# render in a temporary (or tmpfs) directory on CI without touching $HOME.
+base_dir = Path(os.environ.get("PAPYRI_HOME", expanduser("~/.papyri/")))
 base_dir.mkdir(parents=True, exist_ok=True)
 
 html_dir = base_dir / "html"
 html_dir.mkdir(parents=True, exist_ok=True)
 
-ingest_dir = base_dir / "ingest"
+ingest_dir = Path(os.environ.get("PAPYRI_INGEST_DIR", base_dir / "ingest"))
 ingest_dir.mkdir(parents=True, exist_ok=True)
 
+# caches of `papyri gen`, created on first use.
+cache_dir = Path(os.environ.get("PAPYRI_CACHE_DIR", base_dir / "cache"))
+
 
 logo = r"""
   ___                    _
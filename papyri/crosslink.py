@@ -4,6 +4,7 @@ import builtins
 import json
 import logging
 import warnings
+from collections.abc import MutableMapping
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, FrozenSet, List, Optional, Tuple, Any
@@ -27,7 +28,16 @@ from .take2 import (
     Cannonical,
     TocTree,
 )
-from .common_ast import Node, register
+from .common_ast import (
+    DECODERS,
+    ENCODERS,
+    TAG_MAP,
+    Node,
+    check_validation_level,
+    fields,
+    register,
+    should_validate,
+)
 from .tree import PostDVR, resolve_, TreeVisitor
 from .utils import progress, dummy_progress
 
@@ -65,22 +75,6 @@ def find_all_refs(
 @register(4010)
 @dataclass
 class IngestedBlobs(Node):
-    __slots__ = (
-        "content",
-        "ordered_sections",
-        "item_file",
-        "item_line",
-        "item_type",
-        "aliases",
-        "example_section_data",
-        "see_also",
-        "signature",
-        "references",
-        "logo",
-        "qa",
-        "arbitrary",
-    )
-
     content: Dict[str, Section]
     ordered_sections: List[str]
     item_file: Optional[str]
@@ -94,19 +88,12 @@ class IngestedBlobs(Node):
     qa: str
     arbitrary: List[Section]
 
-    __isfrozen = False
-
     @classmethod
     def new(cls):
         return cls({}, None, None, None, None, [], None, None, None, None, None, None)
 
-    def __setattr__(self, key, value):
-        if self.__isfrozen and not hasattr(self, key):
-            raise TypeError("%r is a frozen class" % self)
-        object.__setattr__(self, key, value)
-
-    def _freeze(self):
-        self.__isfrozen = True
+    def cbor(self, encoder):
+        _encode_sectioned(encoder, self)
 
     def all_forward_refs(self) -> List[Key]:
         visitor = TreeVisitor({RefInfo, Fig})
@@ -195,6 +182,169 @@ class IngestedBlobs(Node):
             assert None not in r, r
 
 
+# fields and sections smaller than this (once encoded) are stored inline,
+# decoding them on their own would cost more than it saves.
+_INLINE_SIZE = 256
+
+
+def _write_deferred(cbor_encoder, value) -> None:
+    """
+    Write ``value`` as a byte string containing its encoding, so that it can be
+    decoded only when needed; unless it is small, in which case it is encoded
+    inline.
+    """
+    if isinstance(value, bytes):
+        # already encoded, from a field or section that was never accessed.
+        cbor_encoder.encode(value)
+        return
+    data = encoder.encode(value)
+    if len(data) > _INLINE_SIZE:
+        cbor_encoder.encode(data)
+    else:
+        # encoded again rather than copying data, as shared values
+        # (see Encoder._encode_refinfo) are numbered per document.
+        cbor_encoder.encode(value)
+
+
+class LazySections(MutableMapping):
+    """
+    ``content`` of a `LazyIngestedBlob`: maps section titles to sections,
+    each of them decoded the first time it is accessed.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Dict[str, Any]):
+        # title -> section, or its encoded bytes until it is accessed.
+        self._data: Dict[str, Any] = dict(data)
+
+    def __getitem__(self, title):
+        value = self._data[title]
+        if isinstance(value, bytes):
+            value = self._data[title] = encoder.decode(value)
+        return value
+
+    def __setitem__(self, title, value):
+        self._data[title] = value
+
+    def __delitem__(self, title):
+        del self._data[title]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"<LazySections {list(self._data)}>"
+
+
+@register(4009)
+class LazyIngestedBlob(IngestedBlobs):
+    """
+    `IngestedBlobs` read from the sectioned layout (see `_encode_sectioned`).
+
+    The large fields, and the large sections of ``content``, are only decoded
+    the first time they are accessed; for example the gallery only decodes
+    ``example_section_data``. Fields that were never accessed are written back
+    as is when re-encoding.
+    """
+
+    __slots__ = ("_raw",)
+
+    def __init__(self, data: Dict[str, Any]):
+        # field name -> encoded bytes, for the fields not decoded yet.
+        raw = {}
+        for name, value in data.items():
+            if isinstance(value, bytes):
+                raw[name] = value
+            elif name == "content":
+                setattr(self, name, LazySections(value))
+            else:
+                setattr(self, name, value)
+        self._raw = raw
+
+    @classmethod
+    def _from_values(cls, values):
+        return cls(values)
+
+    def __getattr__(self, name):
+        # only called when the slot of ``name`` is empty, i.e. it has not
+        # been decoded yet.
+        data = object.__getattribute__(self, "_raw").get(name)
+        if data is None:
+            # either not a field, or decoded by another thread in the meantime.
+            return object.__getattribute__(self, name)
+        value = encoder.decode(data)
+        # set before forgetting the bytes, so that other threads always find
+        # one or the other.
+        setattr(self, name, value)
+        self._raw.pop(name, None)
+        return value
+
+    def __eq__(self, other):
+        if not isinstance(other, IngestedBlobs):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in fields(IngestedBlobs).names
+        )
+
+
+def _encode_sectioned(cbor_encoder, blob: IngestedBlobs) -> None:
+    """
+    Encode ``blob`` as a map of field names to the encoded bytes of each
+    field, where ``content`` is itself a map of section titles to the encoded
+    bytes of each section; this acts as an offset table, which lets
+    `LazyIngestedBlob` decode only what is used. Small fields and sections
+    are stored inline instead of as bytes.
+
+    Unlike other dicts, ``content`` is not sorted by the canonical encoding:
+    its order is the order in which sections are rendered.
+    """
+    raw = blob._raw if isinstance(blob, LazyIngestedBlob) else {}
+    names = fields(IngestedBlobs).names
+    # same as encoding CBORTag(tag, {name: value}), field by field.
+    cbor_encoder.encode_length(6, TAG_MAP[LazyIngestedBlob])
+    cbor_encoder.encode_length(5, len(names))
+    for name in names:
+        cbor_encoder.encode(name)
+        data = raw.get(name)
+        if data is not None:
+            cbor_encoder.encode(data)
+        elif name == "content":
+            content = blob.content
+            # sections never accessed are still bytes in a LazySections.
+            sections = content._data if isinstance(content, LazySections) else content
+            cbor_encoder.encode_length(5, len(sections))
+            for title, section in sections.items():
+                cbor_encoder.encode(title)
+                _write_deferred(cbor_encoder, section)
+        else:
+            _write_deferred(cbor_encoder, getattr(blob, name))
+
+
+# Documents are written in the sectioned layout and read back lazily; the
+# previous layout (tag of IngestedBlobs) can still be read.
+ENCODERS[IngestedBlobs] = ENCODERS[LazyIngestedBlob] = _encode_sectioned
+DECODERS[TAG_MAP[LazyIngestedBlob]] = LazyIngestedBlob._from_values
+
+
+def _encode_content(cbor_encoder, content: LazySections) -> None:
+    """
+    Encode ``content`` on its own, e.g. when converting back to the previous
+    layout, keeping the order of the sections.
+    """
+    cbor_encoder.encode_length(5, len(content))
+    for title, section in content.items():
+        cbor_encoder.encode(title)
+        cbor_encoder.encode(section)
+
+
+ENCODERS[LazySections] = _encode_content
+
+
 def load_one_uningested(
     bytes_: bytes,
     qa: str,
@@ -226,9 +376,19 @@ def load_one_uningested(
 
 
 class Ingester:
-    def __init__(self, dp):
+    def __init__(
+        self,
+        dp,
+        storage=None,
+        *,
+        store: Optional[GraphStore] = None,
+        validation_level: str = "full",
+    ):
+        self.validation_level = check_validation_level(validation_level)
         self.ingest_dir = ingest_dir
-        self.gstore = GraphStore(self.ingest_dir)
+        if store is None:
+            store = GraphStore(self.ingest_dir, storage=storage)
+        self.gstore = store
         self.progress = dummy_progress if dp else progress
 
     def _ingest_narrative(self, path, gstore: GraphStore) -> None:
@@ -253,7 +413,8 @@ class Ingester:
 
             module, version = path.name.split("_")
             key = Key(module, version, "docs", ref)
-            doc.validate()
+            if should_validate(self.validation_level, ref):
+                doc.validate()
             gstore.put(
                 key,
                 encoder.encode(doc),
@@ -323,12 +484,17 @@ class Ingester:
 
         gstore.put(
             Key(root, version, "meta", "aliases.cbor"),
-            cbor2.dumps(aliases),
+            cbor2.dumps(aliases, canonical=True),
             # json.dumps(aliases, indent=2).encode(),
             [],
         )
 
     def ingest(self, path: Path, check: bool) -> None:
+        # the whole bundle is written in a single transaction.
+        with self.gstore.batch():
+            self._ingest(path, check)
+
+    def _ingest(self, path: Path, check: bool) -> None:
         gstore = self.gstore
 
         known_refs, _ = find_all_refs(gstore)
@@ -391,7 +557,8 @@ class Ingester:
             for k, v in doc_blob.content.items():
                 assert isinstance(v, Section), f"section {k} is not a Section: {v!r}"
             try:
-                doc_blob.validate()
+                if should_validate(self.validation_level, qa):
+                    doc_blob.validate()
             except Exception as e:
                 raise type(e)(f"from {qa}")
             mod_root = qa.split(".")[0]
@@ -425,11 +592,15 @@ class Ingester:
                 raise RuntimeError(f"error writing to {path}") from e
 
     def relink(self) -> None:
+        with self.gstore.batch():
+            self._relink()
+
+    def _relink(self) -> None:
         gstore = self.gstore
         known_refs, _ = find_all_refs(gstore)
         aliases: Dict[str, str] = {}
         for key in gstore.glob((None, None, "meta", "aliases.cbor")):
-            aliases.update(cbor2.loads(gstore.get(key)))
+            aliases.update(cbor2.loads(gstore.get_view(key)))
 
         rev_aliases = {Cannonical(v): FullQual(k) for k, v in aliases.items()}
 
@@ -481,7 +652,7 @@ class Ingester:
             gstore.glob((None, None, "examples", None)),
             description="Relinking Examples...",
         ):
-            s = encoder.decode(gstore.get(key))
+            s = encoder.decode(gstore.get_view(key))
             assert isinstance(s, Section), (s, key)
             dvr = PostDVR(
                 f"TBD, supposed to be QA relink {key}",
@@ -499,7 +670,9 @@ class Ingester:
             )
 
 
-def main(path, check, *, dummy_progress):
+def main(
+    path, check, *, dummy_progress, storage=None, store=None, validation_level="full"
+):
     """
     Parameters
     ----------
@@ -507,6 +680,14 @@ def main(path, check, *, dummy_progress):
         whether to use a dummy progress bar instead of the rich one.
         Usefull when dropping into PDB.
         To be implemented. See gen step.
+    storage : {None, "files", "pack"}
+        how to store the ingested documents, see `GraphStore`.
+    store : GraphStore, optional
+        store to ingest into, instead of the one in ``config.ingest_dir``;
+        for example an in-memory one.
+    validation_level : {"full", "sample", "off"}
+        which documents to type check before writing them, see
+        `papyri.common_ast.should_validate`.
     check : <Insert Type here>
         <Multiline Description Here>
     path : <Insert Type here>
@@ -519,11 +700,24 @@ def main(path, check, *, dummy_progress):
 
     assert path.exists(), f"{path} does not exists"
     assert path.is_dir(), f"{path} is not a directory"
-    Ingester(dp=dummy_progress).ingest(path, check)
+    Ingester(
+        dp=dummy_progress,
+        storage=storage,
+        store=store,
+        validation_level=validation_level,
+    ).ingest(path, check)
     delta = perf_counter() - now
 
     builtins.print(f"{path.name} Ingesting done in {delta:0.2f}s")
 
 
-def relink(dummy_progress):
-    Ingester(dp=dummy_progress).relink()
+def compact(dummy_progress, store=None):
+    Ingester(dp=dummy_progress, store=store).gstore.compact()
+
+
+def relink(dummy_progress, reindex=False, store=None):
+    ingester = Ingester(dp=dummy_progress, store=store)
+    if reindex:
+        added, removed = ingester.gstore.reindex()
+        builtins.print(f"Reindexed: {added} documents added, {removed} removed")
+    ingester.relink()
@@ -10,28 +10,44 @@ likely be separated into a separate module at some point.
 
 from __future__ import annotations
 
+import ast
 import dataclasses
-import datetime
 import importlib
+import importlib.util
 import inspect
 import json
 import logging
+import multiprocessing
 import os
 import re
 import site
+import sqlite3
 import sys
 import tempfile
+import time
 import warnings
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from functools import lru_cache
 from hashlib import sha256
 from itertools import count
 from pathlib import Path
 from types import FunctionType, ModuleType
-from typing import Any, Dict, List, MutableMapping, Optional, Sequence, Tuple, FrozenSet
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 from hashlib import sha256
 
+import cbor2
 import jedi
 import toml
 from IPython.core.oinspect import find_file
@@ -44,8 +60,9 @@ from rich.progress import BarColumn, Progress, TextColumn
 from there import print
 from velin.examples_section_utils import InOut, splitblank, splitcode
 
+from .config import base_dir, cache_dir
 from .errors import IncorrectInternalDocsLen, NumpydocParseError, UnseenError
-from .miscs import BlockExecutor, DummyP
+from .miscs import BlockExecutor, DummyP, make_executor
 from .take2 import (
     FullQual,
     Cannonical,
@@ -65,10 +82,16 @@ from .take2 import (
     Signature,
     parse_rst_section,
 )
-from .common_ast import Node
+from .common_ast import Node, check_validation_level, should_validate
 from .toc import make_tree
 from .tree import DVR
-from .utils import TimeElapsedColumn, dedent_but_first, pos_to_nl, progress, full_qual
+from .utils import (
+    LinePositions,
+    TimeElapsedColumn,
+    dedent_but_first,
+    progress,
+    full_qual,
+)
 from .vref import NumpyDocString
 
 
@@ -94,6 +117,28 @@ class ErrorCollector:
     def raise_if_unseen_errors(self):
         pass
 
+    def state(self, qas: List[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Unexpected errors, and expected errors not seen yet for ``qas``, to
+        merge into the collector of another process with `update`.
+        """
+        unseen = {
+            qa: self._expected_unseen[qa] for qa in qas if qa in self._expected_unseen
+        }
+        return self._errors, unseen
+
+    def update(self, qas: List[str], errors, unseen) -> None:
+        """
+        Merge the `state` of a collector which handled ``qas``.
+        """
+        for ename, names in errors.items():
+            self._errors.setdefault(ename, []).extend(names)
+        for qa in qas:
+            if qa in unseen:
+                self._expected_unseen[qa] = unseen[qa]
+            else:
+                self._expected_unseen.pop(qa, None)
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is (BaseException, KeyboardInterrupt):
             return
@@ -144,31 +189,233 @@ def paragraph(lines: List[str]) -> Any:
     return p2
 
 
-_JEDI_CACHE = Path("~/.cache/papyri/jedi/").expanduser()
+_JEDI_CACHE = cache_dir / "jedi.db"
+
+# bytes of inference results kept in the jedi cache.
+_JEDI_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class JediCache:
+    """
+    Persistent cache of the tokens and inferred references of examples.
+
+    Each entry holds the results of a group of examples inferred together (see
+    `ScriptInference`), keyed on the text of the group and the examples before
+    it, the names available to them,
+    the version of the documented package and the version of jedi, and are
+    kept in a sqlite database. The database is bounded to ``maxsize`` bytes
+    of results by evicting the least recently used entries.
+
+    The database is opened on first use in each process, so each process of
+    ``gen --jobs`` and each example sandbox uses its own connection;
+    concurrent writers wait for each other.
+    """
+
+    def __init__(self, path: Path, maxsize: int):
+        self.path = path
+        self.maxsize = maxsize
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = os.getpid()
+        # size of the results in the database, as of the last time we looked.
+        self._size = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            # forked, the connection of the parent must not be used.
+            self._conn = None
+            self._pid = os.getpid()
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results(
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                used REAL NOT NULL)
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results(used)")
+            [(self._size,)] = conn.execute("select coalesce(sum(size), 0) from results")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(text: str, names: List[str], version: Optional[str]) -> str:
+        # "groups": entries are lists of results, one for each example.
+        return sha256(
+            repr([text, names, version, jedi.__version__, "groups"]).encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[List[List[Tuple[str, Optional[str]]]]]:
+        conn = self._connect()
+        for (value,) in conn.execute("select value from results where key=?", (key,)):
+            conn.execute("update results set used=? where key=?", (time.time(), key))
+            return [[(text, ref) for text, ref in chunk] for chunk in json.loads(value)]
+        return None
+
+    def set(self, key: str, value: List[List[Tuple[str, Optional[str]]]]) -> None:
+        conn = self._connect()
+        data = json.dumps(value)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # the entry we replace, possibly written by another process, is
+            # not counted twice.
+            for (old_size,) in conn.execute(
+                "select size from results where key=?", (key,)
+            ):
+                self._size -= old_size
+            conn.execute(
+                "insert or replace into results values (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+        self._size += len(data)
+        if self._size > self.maxsize:
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used entries, down to 90% of ``maxsize`` so
+        that we do not evict on every insertion.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            [(size,)] = conn.execute("select coalesce(sum(size), 0) from results")
+            removed = []
+            for key, entry_size in conn.execute(
+                "select key, size from results order by used"
+            ):
+                if size <= self.maxsize * 0.9:
+                    break
+                removed.append((key,))
+                size -= entry_size
+            conn.executemany("delete from results where key=?", removed)
+        self._size = size
+
+
+_jedi_cache = JediCache(_JEDI_CACHE, _JEDI_CACHE_SIZE)
 
 
-def _hashf(text):
-    ##  for cache expiring every day.
-    ## for every hours, change to 0:13.
+_GEN_CACHE = cache_dir / "gen"
 
-    return sha256(text.encode()).hexdigest() + datetime.datetime.now().isoformat()[0:10]
 
+@lru_cache
+def _file_hash(path: Optional[str]) -> Optional[str]:
+    if path is None:
+        return None
+    try:
+        return sha256(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return None
 
-def _jedi_get_cache(text):
-    _JEDI_CACHE.mkdir(exist_ok=True, parents=True)
 
-    _cache = _JEDI_CACHE / _hashf(text)
-    if _cache.exists():
-        return tuple(tuple(x) for x in json.loads(_cache.read_text()))
+def _package_hash(root: str) -> Optional[str]:
+    """
+    Hash of the Python files of the package ``root``, what executed examples
+    may run.
+    """
+    spec = importlib.util.find_spec(root)
+    if spec is None:
+        return None
+    if spec.submodule_search_locations:
+        paths = sorted(
+            p
+            for location in spec.submodule_search_locations
+            for p in Path(location).rglob("*.py")
+        )
+    elif spec.origin is not None:
+        paths = [Path(spec.origin)]
+    else:
+        return None
+    h = sha256()
+    for path in paths:
+        h.update(str(path).encode())
+        h.update(repr(_file_hash(str(path))).encode())
+    return h.hexdigest()
+
 
-    return None
+class GenCache:
+    """
+    Persistent cache of the documents and figures of API objects.
+
+    Entries are keyed on a fingerprint of what the document of an object is
+    built from: its qualified name, docstring, signature, aliases and a hash
+    of the file it is defined in, and a ``context`` for the whole run (papyri
+    version, package version, configuration, and the collected objects which
+    references are resolved to). When examples are executed, the context
+    also has a hash of the Python files of the package, so that any change
+    to them runs the examples again.
+
+    The entries of each context are kept in their own directory under
+    ``path``, so that `prune` only removes stale entries of the current
+    context, and runs with another configuration or version keep theirs.
+
+    Errored objects are not cached, so their errors are collected again on
+    the next run.
+    """
 
+    def __init__(self, path: Path, context: str):
+        self.path = path / context
+        self.context = context
+        self.hits = 0
+        self.misses = 0
 
-def _jedi_set_cache(text, value):
-    _JEDI_CACHE.mkdir(exist_ok=True, parents=True)
+    def key(self, qa: str, target_item: Any, aliases: List[str]) -> str:
+        try:
+            sig: Optional[str] = re.sub(
+                "at 0x[0-9a-f]+", "at 0x0000000", str(inspect.signature(target_item))
+            )
+        except (ValueError, TypeError):
+            sig = None
+        item_file = find_file(target_item)
+        parts = [
+            self.context,
+            qa,
+            str(type(target_item)),
+            target_item.__doc__,
+            sig,
+            aliases,
+            item_file,
+            # the source, and item_line, change with the file.
+            _file_hash(item_file),
+        ]
+        return sha256(repr(parts).encode()).hexdigest()
 
-    _cache = _JEDI_CACHE / _hashf(text)
-    _cache.write_text(json.dumps(value))
+    def get(self, key: str) -> Optional[Tuple[bytes, List[Tuple[str, bytes]]]]:
+        """
+        Encoded document and figures stored at ``key``, if any.
+        """
+        path = self.path / key
+        if not path.exists():
+            self.misses += 1
+            return None
+        self.hits += 1
+        # mark as used for `prune`
+        path.touch()
+        data, figs = cbor2.loads(path.read_bytes())
+        return data, [(name, fig) for name, fig in figs]
+
+    def put(self, key: str, data: bytes, figs: List[Tuple[str, bytes]]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / f"{key}.{os.getpid()}.tmp"
+        tmp.write_bytes(cbor2.dumps([data, figs]))
+        tmp.replace(self.path / key)
+
+    def prune(self, since: float) -> int:
+        """
+        Remove the entries not used since ``since`` (a timestamp), and return
+        how many were removed.
+        """
+        removed = 0
+        for path in self.path.glob("*"):
+            if path.stat().st_mtime < since:
+                path.unlink()
+                removed += 1
+        return removed
 
 
 def obj_from_qualname(name):
@@ -184,8 +431,223 @@ def obj_from_qualname(name):
         return obj
 
 
+class ScriptInference:
+    """
+    Tokenize chunks of code and use Jedi to infer the fully qualified names of
+    their tokens.
+
+    The chunks, typically the examples of a docstring, are added in order with
+    `add`; each chunk is inferred in the context of the chunks before it.
+    Rather than one Jedi context for each chunk and the chunks before it,
+    which would infer the first chunks again and again, consecutive chunks
+    are grouped and inferred in a single context: a chunk starts a new group
+    when it binds a name used in the current group (see `conflicts`), as
+    Jedi would then infer the earlier uses of the name from the later
+    binding. Names are thus never inferred from a later chunk, but the
+    results are not always the same as inferring each chunk on its own:
+    when Jedi finds several candidates for a name, which one comes first
+    can depend on the rest of the group.
+
+    Parameters
+    ----------
+    ns : dict
+        Extra namespace to use with jedi's Interpreter. This will be used for
+        implicit imports, for example that `np` is interpreted as numpy.
+    config : Config
+        current configuration
+    where : str | None
+        where the code comes from, for error messages.
+    version : str | None
+        version of the documented package, results are cached by version.
+    prev : str
+        code before the chunks, which is not tokenized.
+    """
+
+    def __init__(self, ns: Dict, config, *, where=None, version=None, prev: str = ""):
+        assert isinstance(ns, dict)
+        self.ns = ns
+        self.config = config
+        self.where = where
+        self.version = version
+        self.text = prev
+        # script, line of the script in text, end of the script in text and
+        # group, for the chunks added since the last `clear`.
+        self._chunks: List[Tuple[str, int, int, int]] = []
+        # names used by the chunks of the current group.
+        self._used: Set[str] = set()
+
+    def __getstate__(self):
+        # the namespace is that of the process the inference is unpickled in.
+        return {**self.__dict__, "ns": {}}
+
+    def conflicts(self, script: str) -> bool:
+        """
+        Whether ``script`` binds names used by the current group of chunks,
+        in which case adding it starts a new group.
+
+        When the chunks are executed, their namespace is only valid for the
+        current group: the chunks added so far must be inferred (and cleared)
+        before executing ``script``.
+        """
+        bound, _ = _chunk_names(script)
+        return bool(self._chunks) and (bound is None or bool(bound & self._used))
+
+    def add(self, script: str) -> None:
+        group = self._chunks[-1][3] if self._chunks else 0
+        if self.conflicts(script):
+            group += 1
+            self._used = set()
+        self._used |= _chunk_names(script)[1]
+        line = len(self.text.split("\n"))
+        self.text += "\n" + script
+        self._chunks.append((script, line, len(self.text), group))
+
+    def clear(self) -> None:
+        """
+        Forget the chunks added so far, once inferred; they are still the
+        context of the next chunks.
+        """
+        self._chunks = []
+        self._used = set()
+
+    def infer(self) -> List[Optional[List[Tuple[str, Optional[str]]]]]:
+        """
+        Tokens of each chunk added since the last `clear`, with the fully
+        qualified name of the type of the identifiers. The tokens of a chunk
+        are None if Jedi failed on it and the ``jedi_failure_mode`` is "log".
+        """
+        warnings.simplefilter("ignore", UserWarning)
+        groups: Dict[int, List[Tuple[str, int, int]]] = {}
+        for script, line, end, group in self._chunks:
+            groups.setdefault(group, []).append((script, line, end))
+        res: List[Optional[List[Tuple[str, Optional[str]]]]] = []
+        for chunks in groups.values():
+            if not self.config.infer:
+                res.extend(
+                    [(text, "") for _, _, text in _LEXER.get_tokens_unprocessed(script)]
+                    for script, _, _ in chunks
+                )
+                continue
+            text = self.text[: chunks[-1][2]]
+            # the results of a chunk depend on the chunks inferred before it in
+            # the same context, so the results of a group are cached together.
+            cache_key = JediCache.key(text, sorted(self.ns), self.version)
+            cached = _jedi_cache.get(cache_key)
+            if cached is not None:
+                res.extend(cached)
+                continue
+            if self.ns:
+                jed = jedi.Interpreter(text, namespaces=[self.ns])
+            else:
+                jed = jedi.Script(text)
+            inferred = [
+                self._infer_chunk(jed, script, line) for script, line, _ in chunks
+            ]
+            res.extend(inferred)
+            complete = [tokens for tokens in inferred if tokens is not None]
+            if len(complete) == len(inferred):
+                _jedi_cache.set(cache_key, complete)
+        warnings.simplefilter("default", UserWarning)
+        return res
+
+    def _infer_chunk(
+        self, jed, script: str, line: int
+    ) -> Optional[List[Tuple[str, Optional[str]]]]:
+        positions = LinePositions(script)
+        acc: List[Tuple[str, Optional[str]]] = []
+        for index, _type, text in _LEXER.get_tokens_unprocessed(script):
+            ref = None
+            if (text in (" .=()[],")) or not text.isidentifier():
+                acc.append((text, ""))
+                continue
+            line_n, col_n = positions(index)
+            line_n += line
+            try:
+                inf = jed.infer(line_n + 1, col_n)
+                if inf:
+                    # TODO: we might want the qualname to
+                    # be module_name:name for disambiguation.
+                    ref = inf[0].full_name
+            except (AttributeError, TypeError) as e:
+                raise type(e)(
+                    f"{self.text}, {line_n=}, {col_n=}, {line=}, {jed=}"
+                ) from e
+            except jedi.inference.utils.UncaughtAttributeError:
+                if self.config.jedi_failure_mode in (None, "error"):
+                    raise
+                elif self.config.jedi_failure_mode == "log":
+                    print(
+                        "failed inference example will be empty ",
+                        self.where,
+                        line_n,
+                        col_n,
+                    )
+                    return None
+            acc.append((text, ref))
+        return acc
+
+
+_LEXER = PythonLexer()
+
+
+@lru_cache(maxsize=256)
+def _chunk_names(script: str) -> Tuple[Optional[FrozenSet[str]], FrozenSet[str]]:
+    """
+    Names bound and names used (bound or not) by ``script``, see
+    `ScriptInference.conflicts`; cached, as each chunk is looked at by
+    `ScriptInference.conflicts` and `ScriptInference.add`.
+
+    Names whose attributes or items are set count as bound. The bound names
+    are None when they are not known: ``script`` does not parse, or does a
+    star import.
+    """
+    try:
+        tree = ast.parse(script)
+    except (SyntaxError, ValueError):
+        return None, frozenset(
+            text for _, _, text in _LEXER.get_tokens_unprocessed(script)
+        )
+    bound: Set[str] = set()
+    used: Set[str] = set()
+    star = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            used.add(node.id)
+            if not isinstance(node.ctx, ast.Load):
+                bound.add(node.id)
+        elif isinstance(node, (ast.Attribute, ast.Subscript)):
+            if not isinstance(node.ctx, ast.Load):
+                base = node.value
+                while isinstance(base, (ast.Attribute, ast.Subscript)):
+                    base = base.value
+                if isinstance(base, ast.Name):
+                    bound.add(base.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                star |= alias.name == "*"
+                name = alias.asname or alias.name.split(".")[0]
+                used.add(name)
+                bound.add(name)
+        elif not isinstance(node, ast.alias):
+            # functions, classes, except ... as name, and match captures.
+            node_name = getattr(node, "name", None)
+            if isinstance(node_name, str):
+                used.add(node_name)
+                bound.add(node_name)
+    return (None if star else frozenset(bound)), frozenset(used)
+
+
+def _infer_in(ns: Dict, inference: ScriptInference):
+    """
+    Infer the chunks of ``inference`` in the namespace ``ns`` left by executing
+    them, see `miscs.SandboxedExecutor.call`.
+    """
+    inference.ns = ns
+    return inference.infer()
+
+
 def parse_script(
-    script: str, ns: Dict, prev, config, *, where=None
+    script: str, ns: Dict, prev, config, *, where=None, version=None
 ) -> Optional[List[Tuple[str, Optional[str]]]]:
     """
     Parse a script into tokens and use Jedi to infer the fully qualified names
@@ -204,6 +666,8 @@ def parse_script(
         <Multiline Description Here>
     config : <Insert Type here>
         <Multiline Description Here>
+    version : str | None
+        version of the documented package, results are cached by version.
 
     Returns
     -------
@@ -213,61 +677,14 @@ def parse_script(
     reference : str
         fully qualified name of the type of current token
 
+    See Also
+    --------
+    ScriptInference
     """
-    assert isinstance(ns, dict)
-    jeds = []
-    warnings.simplefilter("ignore", UserWarning)
-
-    l_delta = len(prev.split("\n"))
-    contextscript = prev + "\n" + script
-    if ns:
-        jeds.append(jedi.Interpreter(contextscript, namespaces=[ns]))
-    full_text = prev + "\n" + script
-    k = _jedi_get_cache(full_text)
-    if k is not None:
-        return k
-    jeds.append(jedi.Script(full_text))
-    P = PythonLexer()
-
-    acc: List[Tuple[str, Optional[str]]] = []
-
-    for index, _type, text in P.get_tokens_unprocessed(script):
-        line_n, col_n = pos_to_nl(script, index)
-        line_n += l_delta
-        ref = None
-        if not config.infer or (text in (" .=()[],")) or not text.isidentifier():
-            acc.append((text, ""))
-            continue
-
-        for jed in jeds:
-            try:
-                inf = jed.infer(line_n + 1, col_n)
-                if inf:
-                    # TODO: we might want the qualname to
-                    # be module_name:name for disambiguation.
-                    ref = inf[0].full_name
-            except (AttributeError, TypeError) as e:
-                raise type(e)(
-                    f"{contextscript}, {line_n=}, {col_n=}, {prev=}, {jed=}"
-                ) from e
-            except jedi.inference.utils.UncaughtAttributeError:
-                if config.jedi_failure_mode in (None, "error"):
-                    raise
-                elif config.jedi_failure_mode == "log":
-                    print(
-                        "failed inference example will be empty ",
-                        where,
-                        line_n,
-                        col_n,
-                    )
-                    return None
-            break
-        acc.append((text, ref))
-    _jedi_set_cache(full_text, acc)
-    warnings.simplefilter("default", UserWarning)
-    for a in acc:
-        assert len(a) == 2
-    return acc
+    inference = ScriptInference(ns, config, where=where, version=version, prev=prev)
+    inference.add(script)
+    [tokens] = inference.infer()
+    return tokens
 
 
 from enum import Enum
@@ -322,7 +739,6 @@ def get_classes(code):
     """
     Extract Pygments token classes names for given code block
     """
-    list(lex(code, PythonLexer()))
     FMT = HtmlFormatter()
     classes = [FMT.ttype2class.get(x) for x, y in lex(code, PythonLexer())]
     classes = [c if c is not None else "" for c in classes]
@@ -388,6 +804,16 @@ def normalise_ref(ref):
 
 @dataclass
 class Config:
+    """
+    Options of `papyri gen`, from the ``[global]`` section of the
+    configuration file.
+
+    ``exec_timeout`` defaults to 60 seconds: examples that used to run for
+    longer now fail, with the ones after them in the same docstring not
+    executed. Set it to 0 in the configuration file for no limit, as
+    before.
+    """
+
     # we might want to suppress progress/ rich as it infers with ipdb.
     dummy_progress: bool = False
     # Do not actually touch disk
@@ -401,6 +827,11 @@ class Config:
     examples_folder: Optional[str] = None  # < to path ?
     submodules: Sequence[str] = ()
     exec: bool = False
+    # seconds each example may run for before it is stopped, and bytes by which
+    # the address space of the process running the examples may grow (Linux
+    # only); examples over either limit fail. None or 0 for no limit.
+    exec_timeout: Optional[float] = 60
+    exec_memory: Optional[int] = None
     source: Optional[str] = None
     homepage: Optional[str] = None
     docs: Optional[str] = None
@@ -415,6 +846,9 @@ class Config:
     expected_errors: Dict[str, List[str]] = dataclasses.field(default_factory=dict)
     early_error: bool = True
     fail_unseen_error: bool = False
+    # how many documents to type check before writing them, one of
+    # common_ast.VALIDATION_LEVELS.
+    validation_level: str = "full"
 
     def replace(self, **kwargs):
         return dataclasses.replace(self, **kwargs)
@@ -457,6 +891,9 @@ def gen_main(
     fail_early: bool,
     fail_unseen_error: bool,
     limit_to=None,
+    validation_level: Optional[str] = None,
+    jobs: int = 1,
+    cache: bool = True,
 ) -> None:
     """
     Main entry point to generate docbundle files,
@@ -492,6 +929,12 @@ def gen_main(
         overwrite early_error option in config file
     fail_unseen_error : bool
         raise an exception if the error is unseen
+    validation_level : {None, "off", "sample", "full"}
+        CLI override of how many documents to type check before writing them
+    jobs : int
+        number of processes documenting the API
+    cache : bool
+        reuse the documents of unchanged objects from previous runs
 
     Returns
     -------
@@ -508,8 +951,11 @@ def gen_main(
         config.exec = exec_
     if infer is not None:
         config.infer = infer
+    if validation_level is not None:
+        config.validation_level = validation_level
+    check_validation_level(config.validation_level)
 
-    target_dir = Path("~/.papyri/data").expanduser()
+    target_dir = base_dir / "data"
 
     if not target_dir.exists() and not config.dry_run:
         target_dir.mkdir(parents=True, exist_ok=True)
@@ -531,7 +977,9 @@ def gen_main(
     if examples:
         g.collect_examples_out()
     if api:
-        g.collect_api_docs(target_module_name, limit_to=limit_to)
+        g.collect_api_docs(
+            target_module_name, limit_to=limit_to, jobs=jobs, cache=cache
+        )
     if narrative:
         g.collect_narrative_docs()
 
@@ -789,9 +1237,9 @@ def _numpy_data_to_section(data: List[Tuple[str, str, List[str]]], title: str):
             items = parse_rst_section("\n".join(desc))
             for l in items:
                 assert not isinstance(l, Section)
-        acc.append(Param(param, type_, desc=items).validate())
+        acc.append(Param(param, type_, desc=items))
     if acc:
-        return Section([Parameters(acc)], title).validate()
+        return Section([Parameters(acc)], title)
     else:
         return Section([], title)
 
@@ -884,6 +1332,9 @@ class APIObjectInfo:
         return res[0]
 
     def validate(self):
+        # this is the only type check of the parsed sections, and must stay
+        # here as the errors are collected and expected per object, see
+        # `ErrorCollector`.
         for p in self.parsed:
             assert isinstance(
                 p, (Section, NumpydocExample, NumpydocSeeAlso, NumpydocSignature)
@@ -1018,6 +1469,9 @@ class Gen:
         self.examples = {}
         self.docs = {}
         self._doctree: Dict[str, str] = {}
+        self._cache: Optional[GenCache] = None
+        # time spent inferring the examples of each object
+        self.infer_times: Dict[str, float] = {}
 
     def get_example_data(
         self, example_section, *, obj, qa: str, config, log
@@ -1090,8 +1544,6 @@ class Gen:
         import matplotlib.pyplot as plt
         import numpy as np
 
-        acc = ""
-
         def _figure_names():
             """
             File system can be case insensitive, we are not.
@@ -1107,7 +1559,9 @@ class Gen:
         ns.update(_get_implied_imports(obj))
         for k, v in config.implied_imports.items():
             ns[k] = obj_from_qualname(v)
-        executor = BlockExecutor(ns)
+        executor = make_executor(
+            ns, timeout=config.exec_timeout, memory=config.exec_memory
+        )
         all_figs = []
         # fig_managers = _pylab_helpers.Gcf.get_all_fig_managers()
         fig_managers = executor.fig_man()
@@ -1116,7 +1570,28 @@ class Gen:
         if qa in config.exclude_jedi:
             config = config.replace(infer=False)
             log.debug(f"Turning off type inference for func {qa!r}")
+        inference = ScriptInference(ns, config, where=qa, version=self.version)
+        # code blocks, whose tokens are inferred by groups (see ScriptInference).
+        codes: List[Code] = []
+        inferred: List[Optional[List[Tuple[str, Optional[str]]]]] = []
+        infer_time = 0.0
+
+        def infer_group():
+            nonlocal infer_time
+            start = time.perf_counter()
+            try:
+                # jedi can see the objects created by the examples so far.
+                inferred.extend(executor.call(_infer_in, inference))
+            except (TimeoutError, ChildProcessError):
+                log.warning("Inferring the examples of %s in the sandbox failed", qa)
+                inferred.extend(inference.infer())
+            inference.clear()
+            infer_time += time.perf_counter() - start
+
         chunks = (it for block in blocks for it in block)
+        # set once the examples' process timed out or died, taking the names
+        # the examples defined with it.
+        sandbox_lost = False
         with executor:
             for item in chunks:
                 figs = []
@@ -1125,9 +1600,16 @@ class Gen:
                     example_section_data.append(Words("\n".join(item.out)))
                     continue
                 script, out, ce_status = _execute_inout(item)
+                if inference.conflicts(script):
+                    # infer the group before its namespace changes.
+                    infer_group()
                 raise_in_fig = None
                 did_except = False
-                if config.exec and ce_status == ExecutionStatus.compiled.value:
+                if (
+                    config.exec
+                    and ce_status == ExecutionStatus.compiled.value
+                    and not sandbox_lost
+                ):
                     if not wait_for_show:
                         # we should aways have 0 figures
                         # unless stated otherwise
@@ -1136,8 +1618,20 @@ class Gen:
                         res = object()
                         try:
                             res, fig_managers, sout, serr = executor.exec(script)
+                            if isinstance(executor, BlockExecutor) and res is not None:
+                                # like SandboxedExecutor, which gives the repr.
+                                res = repr(res)
                             ce_status = "execed"
-                        except Exception:
+                        except Exception as e:
+                            if isinstance(e, (TimeoutError, ChildProcessError)):
+                                # the next examples would fail on the names this
+                                # process defined, do not execute them.
+                                sandbox_lost = True
+                                log.warning(
+                                    "Not executing the remaining examples of %s: %s",
+                                    qa,
+                                    e,
+                                )
                             if "Traceback" not in "\n".join(out):
                                 script = script.replace("\n", "\n>>> ")
                                 script = ">>> " + script
@@ -1166,7 +1660,7 @@ class Gen:
                             raise_in_fig = True
                             for fig, figname in zip(executor.get_figs(), figure_names):
                                 figs.append((figname, fig))
-                            plt.close("all")
+                            executor.close_figs()
                             raise_in_fig = False
 
                     except Exception:
@@ -1185,39 +1679,40 @@ class Gen:
                                     print(
                                         f"Still fig manager(s) open for {qa}: {figname}"
                                     )
-                                plt.close("all")
+                                executor.close_figs()
                             fig_managers = executor.fig_man()
                             assert len(fig_managers) == 0, fig_managers + [
                                 did_except,
                             ]
                     # we've executed, we now want to compare output
                     # in the docstring with the one we produced.
-                    if (out == repr(res)) or (res is None and out == []):
+                    if ("\n".join(out) == res) or (res is None and out == []):
                         pass
                     else:
                         pass
                         # captured output differ TBD
-                entries = parse_script(script, ns=ns, prev=acc, config=config, where=qa)
-                if entries is None:
-                    entries = [("jedi failed", "jedi failed")]
-                entries = _add_classes(entries)
-                tok_entries = [GenToken(*x) for x in entries]  # type: ignore
-
-                acc += "\n" + script
-                example_section_data.append(
-                    Code(tok_entries, "\n".join(item.out), ce_status)
-                )
+                inference.add(script)
+                codes.append(Code([], "\n".join(item.out), ce_status))
+                example_section_data.append(codes[-1])
                 for figname, _ in figs:
                     example_section_data.append(
                         Fig(RefInfo(self.root, self.version, "assets", figname))
                     )
                 all_figs.extend(figs)
 
-        # TODO fix this if plt.close not called and still a ligering figure.
-        fig_managers = executor.fig_man()
-        if len(fig_managers) != 0:
-            print(f"Unclosed figures in {qa}!!")
-            plt.close("all")
+            # TODO fix this if plt.close not called and still a ligering figure.
+            fig_managers = executor.fig_man()
+            if len(fig_managers) != 0:
+                print(f"Unclosed figures in {qa}!!")
+                executor.close_figs()
+
+            infer_group()
+        for code, entries in zip(codes, inferred):
+            if entries is None:
+                entries = [("jedi failed", "jedi failed")]
+            code.entries = [GenToken(*x) for x in _add_classes(entries)]
+        self.infer_times[qa] = infer_time
+        log.debug("Inferred examples of %s in %.2fs", qa, self.infer_times[qa])
 
         return processed_example_data(example_section_data), all_figs
 
@@ -1304,7 +1799,8 @@ class Gen:
                 blob.see_also = []
                 blob.signature = Signature(None)
                 blob.references = None
-                blob.validate()
+                if should_validate(self.config.validation_level, key):
+                    blob.validate()
                 titles = [s.title for s in blob.arbitrary if s.title]
                 if not titles:
                     title = f"<No Title {key}>"
@@ -1600,7 +2096,7 @@ class Gen:
                         raise type(e)(f"from {qa}")
                     for l in items:
                         assert not isinstance(l, Section)
-                new_content.append(Param(param, type_, desc=items).validate())
+                new_content.append(Param(param, type_, desc=items))
             if new_content:
                 blob.content[s] = Section([Parameters(new_content)], None)
             else:
@@ -1634,7 +2130,9 @@ class Gen:
             for example in examples:
                 p2.update(taskp, description=compress_user(str(example)).ljust(7))
                 p2.advance(taskp)
-                executor = BlockExecutor({})
+                executor = make_executor(
+                    {}, timeout=config.exec_timeout, memory=config.exec_memory
+                )
                 script = example.read_text()
                 ce_status = "None"
                 figs = []
@@ -1658,6 +2156,7 @@ class Gen:
                     ns={},
                     prev="",
                     config=config,
+                    version=self.version,
                 )
 
                 entries: List[Any]
@@ -1821,7 +2320,9 @@ class Gen:
         self._meta.update({"logo": logo, "module": root, "version": self.version})
         self._meta.update(meta)
 
-    def collect_api_docs(self, root: str, limit_to: List[str]):
+    def collect_api_docs(
+        self, root: str, limit_to: List[str], jobs: int = 1, cache: bool = True
+    ):
         """
         Crawl one module and stores resulting docbundle in self.store.
 
@@ -1834,6 +2335,13 @@ class Gen:
             we may want to generate documentation for only a single item.
             If this list is non-empty we will collect documentation
             just for these items.
+        jobs : int
+            Number of processes documenting the collected items, see
+            `_collect_api_docs_parallel`.
+        cache : bool
+            Reuse the documents of unchanged objects from previous runs, see
+            `GenCache`. Entries of objects which are not documented anymore
+            are removed, unless ``limit_to`` is given.
 
         See Also
         --------
@@ -1874,154 +2382,71 @@ class Gen:
             {RefInfo(root, self.version, "module", qa) for qa in collected.keys()}
         )
 
-        error_collector = ErrorCollector(self.config, self.log)
-        # with self.progress() as p2:
-        # just nice display of progression.
-        # taskp = p2.add_task(description="parsing", total=len(collected))
-
-        failure_collection: Dict[str, List[str]] = defaultdict(lambda: [])
-
-        for qa, target_item in collected.items():
-            # p2.update(taskp, description=qa)
-            # p2.advance(taskp)
+        if cache and not self.config.dry_run:
+            from . import __version__
 
-            with error_collector(qa=qa) as ecollector:
-                item_docstring, arbitrary, api_object = self.helper_1(
-                    qa=qa,
-                    target_item=target_item,
-                )
-            if ecollector.errored:
-                if ecollector._errors.keys():
-                    self.log.warning(
-                        "error with %s %s", qa, list(ecollector._errors.keys())
-                    )
-                else:
-                    self.log.info("only expected error with %s", qa)
-                continue
-            assert api_object is not None, ecollector.errored
+            context = [
+                __version__,
+                self.version,
+                self.config.replace(dummy_progress=False),
+                sorted(collected),
+                sorted(rev_aliases.items()),
+            ]
+            if self.config.exec:
+                context.append(_package_hash(root))
+            self._cache = GenCache(
+                _GEN_CACHE / root, sha256(repr(context).encode()).hexdigest()
+            )
+            # with a margin for the resolution of file modification times.
+            started = time.time() - 1
 
-            try:
-                if item_docstring is None:
-                    ndoc = NumpyDocString(dedent_but_first("No Docstrings"))
-                else:
-                    ndoc = NumpyDocString(dedent_but_first(item_docstring))
-                    # note currentlu in ndoc we use:
-                    # _parsed_data
-                    # direct access to  ["See Also"], and [""]
-                    # and :
-                    # ndoc.ordered_sections
-            except Exception as e:
-                if not isinstance(target_item, ModuleType):
-                    self.log.exception(
-                        "Unexpected error parsing %s – %s",
-                        qa,
-                        target_item.__name__,
-                    )
-                    failure_collection["NumpydocError-" + str(type(e))].append(qa)
-                if isinstance(target_item, ModuleType):
-                    # TODO: ndoc-placeholder : remove placeholder here
-                    ndoc = NumpyDocString(f"To remove in the future –– {qa}")
-                else:
-                    continue
-            if not isinstance(target_item, ModuleType):
-                arbitrary = []
-            ex = self.config.exec
-            if self.config.exec and any(
-                qa.startswith(pat) for pat in self.config.execute_exclude_patterns
-            ):
-                ex = False
+        error_collector = ErrorCollector(self.config, self.log)
+        failure_collection: Dict[str, List[str]] = defaultdict(lambda: [])
 
-            # TODO: ndoc-placeholder : make sure ndoc placeholder handled here.
-            assert api_object is not None
-            with error_collector(qa=qa) as c:
-                doc_blob, figs = self.prepare_doc_for_one_object(
+        if jobs > 1:
+            self._collect_api_docs_parallel(
+                list(collected),
+                jobs,
+                known_refs=known_refs,
+                rev_aliases=rev_aliases,
+                error_collector=error_collector,
+                failure_collection=failure_collection,
+            )
+        else:
+            for qa, target_item in collected.items():
+                res = self._collect_one(
+                    qa,
                     target_item,
-                    ndoc,
-                    qa=qa,
-                    config=self.config.replace(exec=ex),
                     aliases=collector.aliases[qa],
-                    api_object=api_object,
-                )
-            if c.errored:
-                continue
-            _local_refs: List[str] = []
-
-            sections_ = [
-                "Parameters",
-                "Returns",
-                "Raises",
-                "Yields",
-                "Attributes",
-                "Other Parameters",
-                "Warns",
-                ##"Warnings",
-                "Methods",
-                # "Summary",
-                "Receives",
-            ]
-            for s in sections_:
-                for child in doc_blob.content.get(s, []):
-                    if isinstance(child, Parameters):
-                        for param in child.children:
-                            new_ref = [u.strip() for u in param[0].split(",") if u]
-                            if new_ref:
-                                _local_refs = _local_refs + new_ref
-
-            # def flat(l) -> List[str]:
-            #    return [y for x in l for y in x]
-            for lr1 in _local_refs:
-                assert isinstance(lr1, str)
-            # lr: FrozenSet[str] = frozenset(flat(_local_refs))
-            lr: FrozenSet[str] = frozenset(_local_refs)
-            dv = DVR(qa, known_refs, local_refs=lr, aliases={}, version=self.version)
-            doc_blob.arbitrary = [dv.visit(s) for s in arbitrary]
-            doc_blob.example_section_data = dv.visit(doc_blob.example_section_data)
-
-            for section in ["Extended Summary", "Summary", "Notes"] + sections_:
-                if section in doc_blob.content:
-                    doc_blob.content[section] = dv.visit(doc_blob.content[section])
-
-            for sa in doc_blob.see_also:
-                from .tree import resolve_
-
-                r = resolve_(
-                    qa,
-                    known_refs,
-                    frozenset(),
-                    sa.name.value,
+                    known_refs=known_refs,
                     rev_aliases=rev_aliases,
+                    error_collector=error_collector,
+                    failure_collection=failure_collection,
                 )
-                assert isinstance(r, RefInfo)
-                if r.kind == "module":
-                    sa.name.reference = r
-                else:
-                    imp = DVR._import_solver(sa.name.value)
-                    if imp:
-                        self.log.debug(
-                            "TODO: see also resolve for %s in %s, %s",
-                            sa.name.value,
-                            qa,
-                            imp,
-                        )
-
-            # eg, dask: str, dask.array.gufunc.apply_gufun: List[str]
-            assert isinstance(doc_blob.references, (list, str, type(None))), (
-                repr(doc_blob.references),
-                qa,
+                if res is None:
+                    continue
+                doc_blob, figs = res
+                self.put(qa, doc_blob)
+                for name, data in figs:
+                    self.put_raw(name, data)
+        if self.infer_times:
+            slowest = sorted(self.infer_times.items(), key=lambda x: -x[1])[:5]
+            self.log.info(
+                "Inferred the examples of %s objects in %.1fs, slowest: %s",
+                len(self.infer_times),
+                sum(self.infer_times.values()),
+                ", ".join(f"{qa} ({t:.2f}s)" for qa, t in slowest),
             )
-
-            if isinstance(doc_blob.references, str):
-                print(repr(doc_blob.references))
-            doc_blob.references = None
-
-            # end processing
-            try:
-                doc_blob.validate()
-            except Exception as e:
-                raise type(e)(f"Error in {qa}")
-            self.put(qa, doc_blob)
-            for name, data in figs:
-                self.put_raw(name, data)
+        if self._cache is not None:
+            self.log.info(
+                "Reused %s of %s documents from the cache",
+                self._cache.hits,
+                self._cache.hits + self._cache.misses,
+            )
+            if not limit_to:
+                removed = self._cache.prune(started)
+                self.log.debug("Removed %s stale cache entries", removed)
+            self._cache = None
         if error_collector._errors:
             self.log.info(
                 "ERRORS:" + toml.dumps(error_collector._errors).replace(",", ",    \n")
@@ -2042,6 +2467,312 @@ class Gen:
             }
         )
 
+    def _collect_one(
+        self,
+        qa: str,
+        target_item: Any,
+        *,
+        aliases: List[str],
+        known_refs: FrozenSet[RefInfo],
+        rev_aliases: Dict[Cannonical, FullQual],
+        error_collector: ErrorCollector,
+        failure_collection: Dict[str, List[str]],
+    ) -> Optional[Tuple[DocBlob, List[Tuple[str, bytes]]]]:
+        """
+        Document one collected object, and resolve its references.
+
+        Returns the DocBlob and the figures of ``target_item``, or None if it
+        errored; errors are recorded in ``error_collector`` and
+        ``failure_collection``.
+
+        See Also
+        --------
+        collect_api_docs
+        """
+        key = None
+        if self._cache is not None:
+            key = self._cache.key(qa, target_item, aliases)
+            cached = self._cache.get(key)
+            if cached is not None:
+                # still report expected errors which were not seen.
+                with error_collector(qa=qa):
+                    pass
+                data, figs = cached
+                return DocBlob.from_json(data), figs
+
+        with error_collector(qa=qa) as ecollector:
+            item_docstring, arbitrary, api_object = self.helper_1(
+                qa=qa,
+                target_item=target_item,
+            )
+        if ecollector.errored:
+            if ecollector._errors.keys():
+                self.log.warning(
+                    "error with %s %s", qa, list(ecollector._errors.keys())
+                )
+            else:
+                self.log.info("only expected error with %s", qa)
+            return None
+        assert api_object is not None, ecollector.errored
+
+        try:
+            if item_docstring is None:
+                ndoc = NumpyDocString(dedent_but_first("No Docstrings"))
+            else:
+                ndoc = NumpyDocString(dedent_but_first(item_docstring))
+                # note currentlu in ndoc we use:
+                # _parsed_data
+                # direct access to  ["See Also"], and [""]
+                # and :
+                # ndoc.ordered_sections
+        except Exception as e:
+            if not isinstance(target_item, ModuleType):
+                self.log.exception(
+                    "Unexpected error parsing %s – %s",
+                    qa,
+                    target_item.__name__,
+                )
+                failure_collection["NumpydocError-" + str(type(e))].append(qa)
+            if isinstance(target_item, ModuleType):
+                # TODO: ndoc-placeholder : remove placeholder here
+                ndoc = NumpyDocString(f"To remove in the future –– {qa}")
+            else:
+                return None
+        if not isinstance(target_item, ModuleType):
+            arbitrary = []
+        ex = self.config.exec
+        if self.config.exec and any(
+            qa.startswith(pat) for pat in self.config.execute_exclude_patterns
+        ):
+            ex = False
+
+        # TODO: ndoc-placeholder : make sure ndoc placeholder handled here.
+        assert api_object is not None
+        with error_collector(qa=qa) as c:
+            doc_blob, figs = self.prepare_doc_for_one_object(
+                target_item,
+                ndoc,
+                qa=qa,
+                config=self.config.replace(exec=ex),
+                aliases=aliases,
+                api_object=api_object,
+            )
+        if c.errored:
+            return None
+        _local_refs: List[str] = []
+
+        sections_ = [
+            "Parameters",
+            "Returns",
+            "Raises",
+            "Yields",
+            "Attributes",
+            "Other Parameters",
+            "Warns",
+            ##"Warnings",
+            "Methods",
+            # "Summary",
+            "Receives",
+        ]
+        for s in sections_:
+            for child in doc_blob.content.get(s, []):
+                if isinstance(child, Parameters):
+                    for param in child.children:
+                        new_ref = [u.strip() for u in param[0].split(",") if u]
+                        if new_ref:
+                            _local_refs = _local_refs + new_ref
+
+        # def flat(l) -> List[str]:
+        #    return [y for x in l for y in x]
+        for lr1 in _local_refs:
+            assert isinstance(lr1, str)
+        # lr: FrozenSet[str] = frozenset(flat(_local_refs))
+        lr: FrozenSet[str] = frozenset(_local_refs)
+        dv = DVR(qa, known_refs, local_refs=lr, aliases={}, version=self.version)
+        doc_blob.arbitrary = [dv.visit(s) for s in arbitrary]
+        doc_blob.example_section_data = dv.visit(doc_blob.example_section_data)
+
+        for section in ["Extended Summary", "Summary", "Notes"] + sections_:
+            if section in doc_blob.content:
+                doc_blob.content[section] = dv.visit(doc_blob.content[section])
+
+        for sa in doc_blob.see_also:
+            from .tree import resolve_
+
+            r = resolve_(
+                qa,
+                known_refs,
+                frozenset(),
+                sa.name.value,
+                rev_aliases=rev_aliases,
+            )
+            assert isinstance(r, RefInfo)
+            if r.kind == "module":
+                sa.name.reference = r
+            else:
+                imp = DVR._import_solver(sa.name.value)
+                if imp:
+                    self.log.debug(
+                        "TODO: see also resolve for %s in %s, %s",
+                        sa.name.value,
+                        qa,
+                        imp,
+                    )
+
+        # eg, dask: str, dask.array.gufunc.apply_gufun: List[str]
+        assert isinstance(doc_blob.references, (list, str, type(None))), (
+            repr(doc_blob.references),
+            qa,
+        )
+
+        if isinstance(doc_blob.references, str):
+            print(repr(doc_blob.references))
+        doc_blob.references = None
+
+        # end processing
+        try:
+            if should_validate(self.config.validation_level, qa):
+                doc_blob.validate()
+        except Exception as e:
+            raise type(e)(f"Error in {qa}")
+        if key is not None:
+            assert self._cache is not None
+            self._cache.put(key, doc_blob.to_json(), figs)
+        return doc_blob, figs
+
+    def _collect_api_docs_parallel(
+        self,
+        qas: List[str],
+        jobs: int,
+        *,
+        known_refs: FrozenSet[RefInfo],
+        rev_aliases: Dict[Cannonical, FullQual],
+        error_collector: ErrorCollector,
+        failure_collection: Dict[str, List[str]],
+    ) -> None:
+        """
+        Document the objects ``qas`` in ``jobs`` worker processes.
+
+        Each worker imports the package and collects its objects once, then
+        documents the shards of ``qas`` it is given. Documents, figures and
+        errors are merged back in the order of ``qas``, so the bundle does not
+        depend on the number of workers.
+
+        Workers are spawned rather than forked, as the current process may
+        have imported and executed arbitrary code from the package.
+        """
+        shards = [qas[i : i + _SHARD_SIZE] for i in range(0, len(qas), _SHARD_SIZE)]
+        self.log.info("Documenting %s items in %s processes", len(qas), jobs)
+        pool = ProcessPoolExecutor(
+            jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                self.config,
+                self.root,
+                self.version,
+                known_refs,
+                rev_aliases,
+                self.log.level,
+                self._cache,
+            ),
+        )
+        futures = [pool.submit(_collect_shard, shard) for shard in shards]
+        try:
+            for shard, future in zip(shards, futures):
+                (
+                    docs,
+                    errors,
+                    unseen,
+                    failures,
+                    cache_stats,
+                    infer_times,
+                ) = future.result()
+                for qa, data, figs in docs:
+                    self.put(qa, DocBlob.from_json(data))
+                    for name, fig in figs:
+                        self.put_raw(name, fig)
+                error_collector.update(shard, errors, unseen)
+                for key, names in failures.items():
+                    failure_collection[key].extend(names)
+                if self._cache is not None:
+                    self._cache.hits += cache_stats[0]
+                    self._cache.misses += cache_stats[1]
+                self.infer_times.update(infer_times)
+        finally:
+            # do not wait for the remaining shards if one failed; this is
+            # shutdown(cancel_futures=True), which needs Python 3.9.
+            for future in futures:
+                future.cancel()
+            pool.shutdown()
+
+
+# number of objects documented by a worker process at a time.
+_SHARD_SIZE = 8
+
+# state of the worker processes of `Gen._collect_api_docs_parallel`, set by
+# `_init_worker`.
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(config, root, version, known_refs, rev_aliases, level, cache):
+    gen = Gen(dummy_progress=True, config=config)
+    gen.log.setLevel(level)
+    gen.root = root
+    gen.version = version
+    gen._cache = cache
+    collector = gen._get_collector()
+    _worker.update(
+        gen=gen,
+        collector=collector,
+        collected=collector.items(),
+        known_refs=known_refs,
+        rev_aliases=rev_aliases,
+    )
+
+
+def _collect_shard(qas: List[str]):
+    """
+    Document the objects ``qas`` in a worker process.
+
+    Returns the encoded documents and the figures of the objects, the
+    errors to merge into the `ErrorCollector` and failures of the parent, the
+    cache hits and misses, and the time spent inferring examples.
+    """
+    gen: Gen = _worker["gen"]
+    collector: DFSCollector = _worker["collector"]
+    error_collector = ErrorCollector(gen.config, gen.log)
+    failure_collection: Dict[str, List[str]] = defaultdict(lambda: [])
+    docs = []
+    cache = gen._cache
+    if cache is not None:
+        cache.hits = cache.misses = 0
+    gen.infer_times = {}
+    for qa in qas:
+        assert qa in _worker["collected"], f"{qa} not collected in worker process"
+        res = gen._collect_one(
+            qa,
+            _worker["collected"][qa],
+            aliases=collector.aliases[qa],
+            known_refs=_worker["known_refs"],
+            rev_aliases=_worker["rev_aliases"],
+            error_collector=error_collector,
+            failure_collection=failure_collection,
+        )
+        if res is not None:
+            doc_blob, figs = res
+            docs.append((qa, doc_blob.to_json(), figs))
+    errors, unseen = error_collector.state(qas)
+    cache_stats = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    return (
+        docs,
+        errors,
+        unseen,
+        dict(failure_collection),
+        cache_stats,
+        gen.infer_times,
+    )
+
 
 def is_private(path):
     """
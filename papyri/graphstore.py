@@ -1,9 +1,22 @@
 # import json
 import cbor2
+import hashlib
 import sqlite3
-from collections import namedtuple
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 from pathlib import Path as _Path
-from typing import List, Set
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 
 class Path:
@@ -73,110 +86,165 @@ class Path:
 
 Key = namedtuple("Key", ["module", "version", "kind", "path"])
 
+_COLUMNS = ("package", "version", "category", "identifier")
 
-class GraphStore:
+
+def _glob_query(table: str, pattern) -> Tuple[str, List[Any], int]:
     """
-    Class abstraction over the filesystem to store documents in a graph-like
-    structure
+    Build the SQL query to find the rows of ``table`` matching ``pattern``.
 
-    We do not want to use the server or alike as most of our users will use REPL
-    or IDE and performance is not our goal as we are likely going to access
-    nodes infrequently.
+    ``None`` in pattern match any value. If pattern has less than 4 items
+    we query the distinct matching prefixes.
 
-    Plus we are not that much interested in the graph structure (yet), than the
-    local neighborhood.
+    Returns
+    -------
+    query : str
+    params : list
+    n : int
+        number of columns selected
+    """
+    pattern = list(pattern)
+    assert 1 <= len(pattern) <= 4, pattern
+    columns = _COLUMNS[: len(pattern)]
+    conditions = [f"{c}=?" for c, p in zip(columns, pattern) if p is not None]
+    query = f"select distinct {', '.join(columns)} from {table}"
+    if conditions:
+        query += " where " + " AND ".join(conditions)
+    return query, [p for p in pattern if p is not None], len(pattern)
 
-    We also have some specificities around document versions, which I'm not
-    clear yet as to how to deal with, as well as dangling edges.
 
-    Each document is stored with an ~4 item keys:
+def _targets_cte(n: int) -> str:
+    """
+    SQL ``with`` clause defining, for ``n`` wanted keys (as 4n parameters), the
+    ``targets(package, version, category, identifier, dest)`` table of the
+    destination ids referencing each key.
 
-     - package it belongs to
-     - version
-     - kind of document
-     - name of document
+    A key is referenced through its exact destination, or through the same
+    package, category and identifier with a ``"*"`` version, which is how we
+    store references we could not pin to a specific version.
+    """
+    return f"""
+        with wanted(package, version, category, identifier) as (
+            values {", ".join(["(?, ?, ?, ?)"] * n)}
+        ),
+        targets(package, version, category, identifier, dest) as (
+            select wanted.*, destinations.id
+            from wanted inner join destinations using
+                (package, version, category, identifier)
+            union all
+            select wanted.*, destinations.id
+            from wanted inner join destinations on (
+                destinations.package=wanted.package
+            AND destinations.version=(select id from names where name='*')
+            AND destinations.category=wanted.category
+            AND destinations.identifier=wanted.identifier)
+        )
+    """
 
-    Each document will also have references to others, with types; those are our
-    edges.
 
-    When we get a document, we do want to get as well all most recent the
-    documents that reference it and why that is to say the coming edges.
+# stay well under the maximum number of sql variables.
+_CHUNK = 200
 
-    When we put a document, we ask for all the documents this references; and
-    should update the edges accordingly.
 
-    I don't really want to store a global edge document – though it might seem
-    the most reasonable; sqlite ? So I was thinking of storing a companion
-    document with all the back references; but maybe sqlite is a better
-    approach.
+def content_hash(data: bytes) -> str:
+    """
+    Hash of the encoded document ``data``, as stored by `GraphStore.put`.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+# default size of the decoded documents cache, in bytes of encoded documents.
+CACHE_SIZE = 64 * 1024 * 1024
 
-    One more question is about the dangling documents? Like document we have references to,
-    but do not exist yet, and a bunch of other stuff.
 
+class DecodedCache:
     """
+    Least recently used cache of decoded documents.
 
-    def __init__(self, root: _Path, link_finder=None):
-        # for now we are going to try to do in-memory operation, just to
-        # see how we can handle that with SQL, and move to on-disk later.
-        p = _Path("~/.papyri/ingest/papyri.db")
-        p = p.expanduser()
-        if not p.exists():
-            self.conn = sqlite3.connect(str(p))
-            self.conn.execute("PRAGMA foreign_keys = 1")
+    The cache is bounded by the sum of the sizes of the *encoded* documents,
+    which is a cheap proxy for the memory used by the decoded objects; a
+    single entry larger than the cache is never stored.
 
-            print("Creating documents table")
-            self.conn.cursor().execute(
-                """
-                CREATE TABLE documents(
-                id INTEGER PRIMARY KEY,
-                package TEXT NOT NULL,
-                version TEXT NOT NULL,
-                category TEXT NOT NULL,
-                identifier TEXT NOT NULL, unique(package, version, category, identifier))
-                """
-            )
+    Cached objects are shared between callers, which may be in different
+    threads; ``load`` is called without holding the lock, so two threads
+    missing the same key at once may both load it.
 
-            self.conn.cursor().execute(
-                """
-                CREATE TABLE destinations(
-                id INTEGER PRIMARY KEY,
-                package TEXT NOT NULL,
-                version TEXT NOT NULL,
-                category TEXT NOT NULL,
-                identifier TEXT NOT NULL, unique(package, version, category, identifier))
-                """
-            )
+    Each entry records the ``version`` (for example the content hash) of what
+    it was loaded from; a lookup with another version is a miss and replaces
+    the entry.
+    """
 
-            print("Creating links table")
-            self.conn.cursor().execute(
-                """
-                CREATE TABLE links(
-                id INTEGER PRIMARY KEY,
-                source INTEGER NOT NULL,
-                dest INTEGER NOT NULL,
-                metadata TEXT,
-                FOREIGN KEY (source) REFERENCES documents(id) ON DELETE CASCADE
-                FOREIGN KEY (dest) REFERENCES destinations(id) ON DELETE CASCADE)
-                """
-            )
-            for cid in [
-                "CREATE INDEX module on documents(package) ;",
-                "CREATE INDEX px on documents(identifier);",
-                "CREATE INDEX qa on destinations(identifier);",
-                "CREATE INDEX ax on destinations(package, version, category, identifier);",
-                "CREATE INDEX sx on links(source);",
-                "CREATE INDEX dx on links(dest);",
-            ]:
-                self.conn.cursor().execute(cid)
-
-            self.conn.commit()
-        else:
-            self.conn = sqlite3.connect(str(p))
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (version, value, size)
+        self._data: OrderedDict[Hashable, Tuple[Hashable, Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        key: Hashable,
+        load: Callable[[], Tuple[Any, int]],
+        version: Hashable = None,
+    ) -> Any:
+        """
+        Get the value for ``key`` at ``version``, calling ``load()`` to get the
+        value and its size on a miss.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+        value, size = load()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            self._pop(key)
+            if size <= self.maxsize:
+                self._data[key] = (version, value, size)
+                self.currsize += size
+                while self.currsize > self.maxsize:
+                    _, (_, _, s) = self._data.popitem(last=False)
+                    self.currsize -= s
+        return value
+
+    def _pop(self, key: Hashable) -> None:
+        if key in self._data:
+            _, _, size = self._data.pop(key)
+            self.currsize -= size
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, self.currsize)
+
+
+class FileStore:
+    """
+    Store each document in its own file, under
+    ``<root>/<module>/<version>/<kind>/<path>``.
 
-        # assert isinstance(link_finder, dict)
+    This is the simplest storage, easy to inspect and to debug, but it creates
+    one file per document.
+
+    See Also
+    --------
+    papyri.packstore.PackStore
+    """
+
+    def __init__(self, root: _Path):
         assert isinstance(root, _Path)
         self._root = Path(root)
-        self._link_finder = link_finder
 
     def _key_to_path(self, key: Key) -> Path:
         """
@@ -221,61 +289,827 @@ class GraphStore:
         else:
             return path.parts
 
-    def remove(self, key: Key) -> None:
+    def get(self, key: Key) -> bytes:
+        return self._key_to_path(key).read_bytes()
+
+    def get_view(self, key: Key) -> memoryview:
+        return memoryview(self.get(key))
+
+    def put(self, key: Key, data: bytes) -> None:
         path = self._key_to_path(key)
-        path.unlink()
+        path.path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def exists(self, key: Key) -> bool:
+        return self._key_to_path(key).exists()
+
+    def remove(self, key: Key) -> None:
+        self._key_to_path(key).unlink()
+
+    def _meta_path(self, module: str, version: str):
+        assert isinstance(module, str)
+        assert isinstance(version, str)
+        return self._root / module / version / "meta.cbor"
+
+    def put_meta(self, module: str, version: str, data: bytes) -> None:
+        mp = self._meta_path(module, version)
+        mp.path.parent.mkdir(parents=True, exist_ok=True)
+
+        mp.write_bytes(data)
+
+    def get_meta(self, module: str, version: str) -> bytes:
+        mp = self._meta_path(module, version)
+        return mp.read_bytes()
+
+    def compact(self) -> None:
+        """
+        Nothing to compact, overwriting a document replaces its file.
+        """
+        pass
+
+    def glob(self, pattern) -> List[Key]:
+        acc = ""
+        for p in pattern:
+            if p is None:
+                acc += "/*"
+            else:
+                acc += "/" + p
+        acc = acc[1:]
+        try:
+            res = [
+                self._path_to_key(p)
+                for p in self._root.glob(acc)
+                if not p.name.endswith(".br")
+            ]  # !!
+        except Exception as e:
+            raise type(e)("Acc:" + acc, pattern)
+        return res
+
+
+# version of the sqlite schema, stored in `PRAGMA user_version`.
+SCHEMA_VERSION = 3
+
+# a single row counting the write transactions, see `GraphStore.generation`.
+_GENERATION_SCHEMA = [
+    """
+    CREATE TABLE generation(
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    n INTEGER NOT NULL)
+    """,
+    "insert into generation values (0, 0)",
+]
+
+_SCHEMA = [
+    # the package, version and category strings, which repeat on every row of
+    # documents and destinations, are interned here.
+    """
+    CREATE TABLE names(
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE)
+    """,
+    """
+    CREATE TABLE documents(
+    id INTEGER PRIMARY KEY,
+    package INTEGER NOT NULL REFERENCES names(id),
+    version INTEGER NOT NULL REFERENCES names(id),
+    category INTEGER NOT NULL REFERENCES names(id),
+    identifier TEXT NOT NULL,
+    hash TEXT,
+    unique(identifier, package, version, category))
+    """,
+    """
+    CREATE TABLE destinations(
+    id INTEGER PRIMARY KEY,
+    package INTEGER NOT NULL REFERENCES names(id),
+    version INTEGER NOT NULL REFERENCES names(id),
+    category INTEGER NOT NULL REFERENCES names(id),
+    identifier TEXT NOT NULL, unique(identifier, package, version, category))
+    """,
+    """
+    CREATE TABLE links(
+    source INTEGER NOT NULL,
+    dest INTEGER NOT NULL,
+    PRIMARY KEY (source, dest),
+    FOREIGN KEY (source) REFERENCES documents(id) ON DELETE CASCADE
+    FOREIGN KEY (dest) REFERENCES destinations(id) ON DELETE CASCADE)
+    WITHOUT ROWID
+    """,
+    # number of links to each destination, maintained by put, so that we
+    # can weight the nodes of the graph without counting their backrefs.
+    """
+    CREATE TABLE in_degrees(
+    dest INTEGER PRIMARY KEY,
+    n INTEGER NOT NULL,
+    FOREIGN KEY (dest) REFERENCES destinations(id) ON DELETE CASCADE)
+    """,
+    # the unique constraints start with the identifier, which is the largest
+    # column, so that we do not need another index to look it up alone.
+    "CREATE INDEX dpv on documents(package, version, category);",
+    # with the primary key, a covering index in each direction.
+    "CREATE INDEX lds on links(dest, source);",
+    *_GENERATION_SCHEMA,
+    f"PRAGMA user_version = {SCHEMA_VERSION}",
+]
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    for statement in _SCHEMA:
+        conn.execute(statement)
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """
+    Migrate a database created by an older version of papyri to the current
+    schema.
+
+    Version 0 stored the package, version and category strings in each row of
+    ``documents`` and ``destinations``, and had a rowid ``links`` table with an
+    unused ``metadata`` column. Ids of documents and destinations are kept, so
+    links can be copied as is.
+
+    Version 1 did not have the ``hash`` column of ``documents``; it is left
+    empty for existing documents, and filled the next time they are put.
+
+    Version 2 did not have the ``generation`` table.
+    """
+    [(version,)] = conn.execute("PRAGMA user_version")
+    if version == SCHEMA_VERSION:
+        return
+    if version in (1, 2):
+        print("Migrating links database to schema version", SCHEMA_VERSION)
+        with conn:
+            conn.execute("BEGIN")
+            if version == 1:
+                conn.execute("ALTER TABLE documents ADD COLUMN hash TEXT")
+            for statement in _GENERATION_SCHEMA:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return
+    assert version == 0, f"Unknown papyri database schema version {version}"
+    print("Migrating links database to schema version", SCHEMA_VERSION)
+    with conn:
+        # DDL does not implicitly open a transaction.
+        conn.execute("BEGIN")
+        for table in ["links", "documents", "destinations"]:
+            conn.execute(f"ALTER TABLE {table} RENAME TO old_{table}")
+        for index in ["module", "px", "qa", "ax", "sx", "dx", "lsd", "lds"]:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.execute("DROP TABLE IF EXISTS in_degrees")
+        _create_schema(conn)
+        for column in ["package", "version", "category"]:
+            for table in ["old_documents", "old_destinations"]:
+                conn.execute(
+                    f"insert or ignore into names(name) select {column} from {table}"
+                )
+        for table in ["documents", "destinations"]:
+            conn.execute(
+                f"""
+                insert into {table}(id, package, version, category, identifier)
+                select old.id, p.id, v.id, c.id, old.identifier
+                from old_{table} as old
+                    inner join names as p on p.name=old.package
+                    inner join names as v on v.name=old.version
+                    inner join names as c on c.name=old.category
+                """
+            )
+        conn.execute("insert or ignore into links select source, dest from old_links")
+        conn.execute(
+            "insert into in_degrees select dest, count(*) from links group by dest"
+        )
+        for table in ["links", "documents", "destinations"]:
+            conn.execute(f"DROP TABLE old_{table}")
+    conn.execute("VACUUM")
+
+
+class MemoryStore:
+    """
+    Keep documents in a dict.
+
+    This is meant for ephemeral stores (tests, CI renders, benchmarks) that
+    should not touch the disk; everything is lost when the store is closed.
+    Same interface as `FileStore`.
+    """
+
+    def __init__(self):
+        self._data: Dict[Key, bytes] = {}
+        self._meta: Dict[Tuple[str, str], bytes] = {}
+
+    def get(self, key: Key) -> bytes:
+        try:
+            return self._data[key]
+        except KeyError:
+            raise FileNotFoundError(f"No such document {key}") from None
+
+    def get_view(self, key: Key) -> memoryview:
+        return memoryview(self.get(key))
+
+    def put(self, key: Key, data: bytes) -> None:
+        assert None not in key, key
+        self._data[Key(*key)] = bytes(data)
+
+    def exists(self, key: Key) -> bool:
+        return key in self._data
+
+    def remove(self, key: Key) -> None:
+        self.get(key)
+        del self._data[key]
+
+    def put_meta(self, module: str, version: str, data: bytes) -> None:
+        self._meta[(module, version)] = bytes(data)
+
+    def get_meta(self, module: str, version: str) -> bytes:
+        try:
+            return self._meta[(module, version)]
+        except KeyError:
+            raise FileNotFoundError(f"No meta for {module} {version}") from None
+
+    def compact(self) -> None:
+        pass
+
+    def glob(self, pattern) -> List[Any]:
+        """
+        Same as `FileStore.glob`, ``None`` in ``pattern`` match any value; if
+        pattern has less than 4 items we return the distinct matching prefixes
+        as tuples.
+        """
+        n = len(pattern)
+        matches = [
+            k
+            for k in self._data
+            if all(p is None or p == x for p, x in zip(pattern, k))
+        ]
+        if n == 4:
+            return matches
+        return list({tuple(k[:n]): None for k in matches})
+
+
+class _BatchState:
+    """
+    In-memory id maps used by `GraphStore.batch`.
+
+    This mirrors the ``documents`` and ``destinations`` tables so that during
+    a bulk write we do not need one ``SELECT`` per source and per link target
+    to find (or create) their ids.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, decode: Callable[[Any], Key]):
+        self.documents: Dict[Key, int] = {}
+        self.hashes: Dict[Key, Optional[str]] = {}
+        for row in conn.execute(
+            "select id, package, version, category, identifier, hash from documents"
+        ):
+            key = decode(row[1:5])
+            self.documents[key] = row[0]
+            self.hashes[key] = row[5]
+        self.destinations: Dict[Key, int] = {
+            decode(row[1:]): row[0]
+            for row in conn.execute("select * from destinations")
+        }
+        self.rev_destinations: Dict[int, Key] = {
+            v: k for k, v in self.destinations.items()
+        }
+
+
+class GraphStore:
+    """
+    Class abstraction over the filesystem to store documents in a graph-like
+    structure
+
+    We do not want to use the server or alike as most of our users will use REPL
+    or IDE and performance is not our goal as we are likely going to access
+    nodes infrequently.
+
+    Plus we are not that much interested in the graph structure (yet), than the
+    local neighborhood.
+
+    We also have some specificities around document versions, which I'm not
+    clear yet as to how to deal with, as well as dangling edges.
+
+    Each document is stored with an ~4 item keys:
+
+     - package it belongs to
+     - version
+     - kind of document
+     - name of document
+
+    Each document will also have references to others, with types; those are our
+    edges.
+
+    When we get a document, we do want to get as well all most recent the
+    documents that reference it and why that is to say the coming edges.
+
+    When we put a document, we ask for all the documents this references; and
+    should update the edges accordingly.
+
+    I don't really want to store a global edge document – though it might seem
+    the most reasonable; sqlite ? So I was thinking of storing a companion
+    document with all the back references; but maybe sqlite is a better
+    approach.
+
+    One more question is about the dangling documents? Like document we have references to,
+    but do not exist yet, and a bunch of other stuff.
+
+    """
+
+    def __init__(
+        self,
+        root: Optional[_Path],
+        link_finder=None,
+        *,
+        storage=None,
+        cache_size=CACHE_SIZE,
+    ):
+        """
+        Parameters
+        ----------
+        root : Path or None
+            directory in which to store the documents and the ``papyri.db``
+            database. Unused (and may be None) with ``storage="memory"``.
+        link_finder
+            unused
+        storage : {None, "files", "pack", "memory"}
+            how to store the documents' bytes. "files" store one file per
+            document, "pack" append documents to a few pack files per package
+            and version (see `papyri.packstore`). When None, use "pack" if
+            ``root`` already contains pack files, and "files" otherwise.
+            "memory" keeps the documents in a dict and the database in an
+            in-memory sqlite database, nothing is written to disk.
+        cache_size : int
+            maximum size (in bytes of encoded documents) of the cache used by
+            `get_decoded` and `get_meta_decoded`. 0 disables the cache.
+        """
+        if storage not in (None, "files", "pack", "memory"):
+            raise ValueError(
+                f"Unknown storage {storage!r}, expecting 'files', 'pack' or 'memory'"
+            )
+        self._db_path: Optional[_Path] = None
+        if storage == "memory":
+            # a single connection, shared by all threads, see `_read_conn`.
+            self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self.conn.execute("PRAGMA foreign_keys = 1")
+            with self.conn:
+                self.conn.execute("BEGIN")
+                _create_schema(self.conn)
+        else:
+            assert isinstance(root, _Path)
+            self._db_path = root / "papyri.db"
+            if not self._db_path.exists():
+                root.mkdir(parents=True, exist_ok=True)
+                self.conn = sqlite3.connect(str(self._db_path))
+                self.conn.execute("PRAGMA foreign_keys = 1")
+                # readers in other threads or processes don't block the
+                # writer, and are not blocked by it (stored in the db).
+                self.conn.execute("PRAGMA journal_mode = WAL")
+
+                print("Creating documents, destinations and links tables")
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    _create_schema(self.conn)
+            else:
+                self.conn = sqlite3.connect(str(self._db_path))
+                _migrate(self.conn)
+                self.conn.execute("PRAGMA journal_mode = WAL")
+
+        # self.conn is the only connection that writes, and is used by the
+        # thread that created the store; other threads get their own read-only
+        # connection, see `_read_conn`.
+        self._owner = threading.get_ident()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+
+        # string -> id of the `names` table, and reverse.
+        self._names: Dict[str, int] = {}
+        self._rev_names: Dict[int, str] = {}
+        self._load_names()
+
+        # assert isinstance(link_finder, dict)
+        self._link_finder = link_finder
+        self._blobs: Any
+        if storage == "memory":
+            self._blobs = MemoryStore()
+        else:
+            assert isinstance(root, _Path)
+            if storage is None:
+                storage = "pack" if (root / "packs").exists() else "files"
+            if storage == "files":
+                self._blobs = FileStore(root)
+            else:
+                from .packstore import PackStore
+
+                self._blobs = PackStore(
+                    root / "packs", self.conn, self, reader=self._read_conn
+                )
+        self._batch: Optional[_BatchState] = None
+        self._cache = DecodedCache(cache_size)
+        # id of a connection -> (its data_version, {key: stored hash}), see
+        # `_stored_hash`.
+        self._hashes: Dict[int, Tuple[int, Dict[Key, Optional[str]]]] = {}
+
+    def _read_conn(self) -> sqlite3.Connection:
+        """
+        Connection to use for read only queries.
+
+        This is the writer connection in the thread that created the store, so
+        that reads see the current transaction; in other threads (e.g. the
+        workers of ``papyri serve``), a read-only connection per thread, which
+        can query concurrently with the writer thanks to WAL. In-memory
+        databases can't be opened twice, so they always use the writer
+        connection.
+        """
+        if threading.get_ident() == self._owner or self._db_path is None:
+            return self.conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self._db_path.as_uri() + "?mode=ro", uri=True, check_same_thread=False
+            )
+            self._local.conn = conn
+            self._readers.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """
+        Close the writer and all the reader connections.
+        """
+        for conn in self._readers:
+            conn.close()
+        self._readers.clear()
+        self._hashes.clear()
+        self.conn.close()
+
+    def _load_names(self) -> None:
+        for id_, name in self._read_conn().execute("select id, name from names"):
+            self._names[name] = id_
+            self._rev_names[id_] = name
+
+    def _name_id(self, name: str, create: bool = False) -> Optional[int]:
+        """
+        Id of ``name`` in the ``names`` table.
+
+        Returns None if ``name`` is not known, unless ``create`` is True, in which
+        case it is added.
+        """
+        if name not in self._names:
+            # might have been added by someone else.
+            if create:
+                self.conn.execute(
+                    "insert or ignore into names(name) values (?)", (name,)
+                )
+            conn = self.conn if create else self._read_conn()
+            for (id_,) in conn.execute("select id from names where name=?", (name,)):
+                self._names[name] = id_
+                self._rev_names[id_] = name
+        return self._names.get(name)
+
+    def _encode(self, key, create: bool = False) -> Optional[List[Any]]:
+        """
+        Convert a key to the values of the corresponding row, with the ids of
+        its package, version and category.
+
+        Returns None if one of those is not known (and not ``create``), as no
+        row can match the key then.
+        """
+        ids = [self._name_id(x, create) for x in key[:3]]
+        if None in ids:
+            return None
+        return [*ids, key[3]]
+
+    def _name(self, id_: int) -> str:
+        if id_ not in self._rev_names:
+            self._load_names()
+        return self._rev_names[id_]
+
+    def _decode(self, row) -> Key:
+        """
+        Opposite of `_encode`.
+        """
+        return Key(self._name(row[0]), self._name(row[1]), self._name(row[2]), row[3])
+
+    def _encode_new(self, key) -> List[Any]:
+        """
+        `_encode`, registering the names of ``key`` that are not known yet.
+        """
+        values = self._encode(key, create=True)
+        assert values is not None
+        return values
+
+    def _encode_many(self, keys) -> List[List[Any]]:
+        """
+        `_encode` all of ``keys``, skipping the ones that can't match any row.
+        """
+        encoded = [self._encode(k) for k in keys]
+        return [e for e in encoded if e is not None]
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager for bulk writes.
+
+        Within this context all the calls to `put` share a single transaction,
+        which is committed when exiting the context (or rolled back on error).
+
+        The ids of documents and destinations are kept in memory, so putting a
+        document costs a constant number of queries instead of a couple of
+        queries per link.
+
+        Nested calls are no-ops and reuse the outer batch.
+
+        Examples
+        --------
+        ::
+
+            with gstore.batch():
+                for key, data, refs in items:
+                    gstore.put(key, data, refs)
+
+        """
+        if self._batch is not None:
+            yield self
+            return
+        try:
+            with self.conn:
+                self._bump_generation()
+                self._batch = _BatchState(self.conn, self._decode)
+                yield self
+        except BaseException:
+            # names created in the transaction are gone.
+            self._names.clear()
+            self._rev_names.clear()
+            self._load_names()
+            raise
+        finally:
+            self._batch = None
+
+    def compact(self) -> None:
+        """
+        Reclaim the space of overwritten documents, if the storage supports it
+        (see `papyri.packstore.PackStore.compact`).
+
+        This is not done by `batch`, as readers in other processes (e.g.
+        ``papyri serve``) may briefly have to look documents up again.
+        """
+        self._blobs.compact()
+
+    @contextmanager
+    def _transaction(self, changes: bool = True):
+        """
+        Same as ``with self.conn``, except within a `batch`, whose transaction
+        is only committed at the end of the batch. Each transaction increments
+        the `generation`, unless it ``changes`` no document or link.
+        """
+        if self._batch is not None:
+            yield
+        else:
+            with self.conn:
+                if changes:
+                    self._bump_generation()
+                yield
+
+    def _invalidate(self, key: Key) -> None:
+        """
+        Forget what is cached about the document at ``key``, which is being
+        changed or removed.
+        """
+        self._cache.invalidate(key)
+        for _, hashes in list(self._hashes.values()):
+            hashes.pop(key, None)
+
+    def _stored_hash(self, key: Key) -> Optional[str]:
+        """
+        `get_hash`, remembered until ``key`` is changed by this store or the
+        database by another connection, which ``PRAGMA data_version`` tells.
+        """
+        conn = self._read_conn()
+        [(version,)] = conn.execute("PRAGMA data_version")
+        memo = self._hashes.get(id(conn))
+        if memo is None or memo[0] != version:
+            memo = self._hashes[id(conn)] = (version, {})
+        hashes = memo[1]
+        if key not in hashes:
+            hashes[key] = self.get_hash(key)
+        return hashes[key]
+
+    def _fill_hash(self, key: Key, digest: str) -> None:
+        """
+        Record the hash of a document put before hashes were recorded.
+        """
+        row = self._encode(key)
+        if row is None:
+            return
+        with self._transaction(changes=False):
+            self.conn.execute(
+                """
+                update documents set hash=? where (
+                    package=?
+                AND version=?
+                AND category=?
+                AND identifier=?
+                AND hash is null)
+                """,
+                [digest, *row],
+            )
+        for _, hashes in list(self._hashes.values()):
+            hashes.pop(key, None)
+
+    def _bump_generation(self) -> None:
+        self.conn.execute("update generation set n = n + 1")
+
+    def generation(self) -> int:
+        """
+        Number of write transactions on the database so far, which changes
+        whenever documents or links may have been added, changed or removed.
+        """
+        [(n,)] = self._read_conn().execute("select n from generation")
+        return n
+
+    def remove(self, key: Key) -> None:
+        self._blobs.remove(key)
+        self._invalidate(key)
+        if self._batch is not None:
+            self._batch.documents.pop(key, None)
+            self._batch.hashes.pop(key, None)
         #  this is likely incorrect if we want to deal with dangling links.
         print("Removing link from table")
-        self.conn.execute(
-            "delete from links where source=?",
-            (str(key),),
-        )
+        self._remove_source(key)
+
+    def _remove_source(self, key: Key) -> None:
+        """
+        Remove ``key`` and its outgoing links from the tables.
+        """
+        row = self._encode(key)
+        if row is None:
+            return
+        with self._transaction():
+            rows = list(
+                self.conn.execute(
+                    """
+                    select id from documents where (
+                        package=?
+                    AND version=?
+                    AND category=?
+                    AND identifier=?)
+                    """,
+                    row,
+                )
+            )
+            if not rows:
+                return
+            [(source_id,)] = rows
+            self._update_in_degrees(
+                [],
+                [
+                    dest
+                    for (dest,) in self.conn.execute(
+                        "select dest from links where source=?", (source_id,)
+                    )
+                ],
+            )
+            self.conn.execute("delete from links where source=?", (source_id,))
+            self.conn.execute("delete from documents where id=?", (source_id,))
 
     def _get(self, key: Key) -> bytes:
         assert isinstance(key, Key)
-        path = self._key_to_path(key)
-
-        # TODO: this is partially incorrect.
-        # as we only match on the identifier,
-        # we should match on more.
-        return path.read_bytes()
+        return self._blobs.get(key)
 
     def _get_backrefs(self, key: Key) -> Set[Key]:
-        cur = self.conn.cursor()
-        backrows = list(
-            cur.execute(
-                """
-        select documents.*
-        from links
-            inner join documents on links.source=documents.id
-            inner join destinations on links.dest=destinations.id
-        where destinations.identifier=?""",
-                (key.path,),
+        return self.get_backrefs_many([key])[key]
+
+    def get_backrefs_many(self, keys) -> Dict[Key, Set[Key]]:
+        """
+        Get the back references of all of ``keys``, in a few queries instead of
+        one per key.
+
+        A document references a key if it links to exactly this key, or to the
+        same package and identifier with a ``"*"`` version, which is how we
+        store references we could not pin to a specific version.
+
+        Returns
+        -------
+        backrefs : dict
+            mapping each of the keys to the set of documents referencing it.
+        """
+        res: Dict[Key, Set[Key]] = {Key(*k): set() for k in keys}
+        encoded = self._encode_many(res)
+        for i in range(0, len(encoded), _CHUNK):
+            part = encoded[i : i + _CHUNK]
+            rows = self._read_conn().execute(
+                _targets_cte(len(part))
+                + """
+                select targets.package, targets.version,
+                       targets.category, targets.identifier,
+                       documents.package, documents.version,
+                       documents.category, documents.identifier
+                from targets
+                    inner join links on links.dest=targets.dest
+                    inner join documents on links.source=documents.id
+                """,
+                [x for k in part for x in k],
             )
-        )
+            for row in rows:
+                res[self._decode(row[:4])].add(self._decode(row[4:]))
+        return res
 
-        sql_backrefs = {Key(*s[1:]) for s in backrows}
-        return sql_backrefs
+    def get_in_degrees(self, keys) -> Dict[Key, int]:
+        """
+        Number of references to each of ``keys``, without listing them.
 
-    def get_forwardrefs(self, key: Key) -> Set[Key]:
-        cur = self.conn.cursor()
-        forward_rows = list(
-            cur.execute(
-                """
-        select destinations.*
-        from links
-            inner join documents on links.source=documents.id
-            inner join destinations on links.dest=destinations.id
-        where documents.identifier=?""",
-                (key.path,),
+        This is read from the ``in_degrees`` table maintained by `put`, and
+        matches ``len(get_backref(key))``, unless a document references a key
+        both with its exact version and with a ``"*"`` version.
+        """
+        res: Dict[Key, int] = {Key(*k): 0 for k in keys}
+        encoded = self._encode_many(res)
+        for i in range(0, len(encoded), _CHUNK):
+            part = encoded[i : i + _CHUNK]
+            rows = self._read_conn().execute(
+                _targets_cte(len(part))
+                + """
+                select targets.package, targets.version,
+                       targets.category, targets.identifier,
+                       sum(in_degrees.n)
+                from targets
+                    inner join in_degrees on in_degrees.dest=targets.dest
+                group by 1, 2, 3, 4
+                """,
+                [x for k in part for x in k],
             )
+            for row in rows:
+                res[self._decode(row[:4])] = row[4]
+        return res
+
+    def get_neighbourhood(
+        self, key: Key, max_nodes: int = 50
+    ) -> Tuple[Dict[Key, int], Set[Tuple[Key, Key]]]:
+        """
+        Get the local reference graph around ``key``, in a constant number of
+        queries.
+
+        Parameters
+        ----------
+        key : Key
+            document at the center of the graph.
+        max_nodes : int
+            if there are more than ``max_nodes`` documents referencing or
+            referenced by ``key``, only keep the most referenced ones, so that
+            there are less than ``max_nodes`` of them.
+
+        Returns
+        -------
+        weights : dict
+            the nodes, mapped to their number of back references.
+        edges : set
+            ``(node, ref)`` pairs, where the document ``ref`` references
+            ``node``, and has the same identifier as one of the nodes.
+        """
+        assert max_nodes <= _CHUNK
+        weights = self.get_in_degrees(self.get_backref(key) | self.get_forwardrefs(key))
+        if len(weights) > max_nodes:
+            for thresh in sorted(set(weights.values())):
+                weights = {k: v for k, v in weights.items() if v > thresh}
+                if len(weights) < max_nodes:
+                    break
+        if not weights:
+            return weights, set()
+        nodes = self._encode_many(weights)
+        rows = self._read_conn().execute(
+            _targets_cte(len(nodes))
+            + """
+            select targets.package, targets.version,
+                   targets.category, targets.identifier,
+                   documents.package, documents.version,
+                   documents.category, documents.identifier
+            from documents
+                cross join links on links.source=documents.id
+                cross join targets on targets.dest=links.dest
+            where documents.identifier in (select identifier from wanted)
+            """,
+            [x for k in nodes for x in k],
         )
+        return weights, {(self._decode(row[:4]), self._decode(row[4:])) for row in rows}
 
-        sql_forward_ref = {Key(*s[1:]) for s in forward_rows}
-        return sql_forward_ref
+    def get_forwardrefs(self, key: Key) -> Set[Key]:
+        row = self._encode(key)
+        if row is None:
+            return set()
+        forward_rows = self._read_conn().execute(
+            """
+            select destinations.package, destinations.version,
+                   destinations.category, destinations.identifier
+            from documents
+                inner join links on links.source=documents.id
+                inner join destinations on links.dest=destinations.id
+            where (
+                documents.package=?
+            AND documents.version=?
+            AND documents.category=?
+            AND documents.identifier=?)
+            """,
+            row,
+        )
+        return {self._decode(s) for s in forward_rows}
 
     def get_all(self, key):
-        a = self._get(key)
+        a = self.get_view(key)
         b = self._get_backrefs(key)
         c = self.get_forwardrefs(key)
         return (a, b, c)
@@ -286,8 +1120,71 @@ class GraphStore:
     def get(self, key: Key) -> bytes:
         return self._get(key)
 
+    def get_decoded(self, key: Key, decode: Callable[[memoryview], Any]) -> Any:
+        """
+        Get the document at ``key`` decoded with ``decode``.
+
+        Decoded documents are kept in a size bounded LRU cache, keyed on the
+        hash stored with the document, so that documents changed by another
+        process are decoded again. The returned object is shared between
+        callers, so it should not be modified.
+
+        Documents put before hashes were recorded are not cached; their hash
+        is filled in when this is called from the thread that created the
+        store (``papyri serve`` reads from other threads, re-ingesting the
+        package fills them as well).
+
+        See Also
+        --------
+        cache_info
+        """
+        digest = self._stored_hash(key)
+        if digest is None:
+            data = self.get_view(key)
+            if threading.get_ident() == self._owner:
+                self._fill_hash(key, content_hash(data))
+            return decode(data)
+
+        def load():
+            data = self.get_view(key)
+            return decode(data), len(data)
+
+        return self._cache.get(key, load, digest)
+
+    def get_meta_decoded(self, key: Key, decode: Callable[[bytes], Any]) -> Any:
+        """
+        Same as `get_decoded`, for the meta document of ``key``'s package.
+        """
+
+        data = self.get_meta(key)
+
+        def load():
+            return decode(data), len(data)
+
+        return self._cache.get(
+            ("meta", key.module, key.version), load, content_hash(data)
+        )
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Statistics of the decoded documents cache, in the same form as
+        `functools.lru_cache`'s ``cache_info()``; sizes are in bytes.
+        """
+        return self._cache.info()
+
+    def get_view(self, key: Key) -> memoryview:
+        """
+        Same as `get`, but avoid copying the document when the storage allows
+        it (see `papyri.packstore`).
+
+        Use this when the bytes are only going to be decoded.
+        """
+        assert isinstance(key, Key)
+        return self._blobs.get_view(key)
+
     def _maybe_insert_source(self, key):
-        with self.conn:
+        with self._transaction():
+            row = self._encode_new(key)
             c1 = self.conn.cursor()
             rows = list(
                 c1.execute(
@@ -298,16 +1195,16 @@ class GraphStore:
                 AND category=?
                 AND identifier=?)
                 """,
-                    list(key),
+                    row,
                 )
             )
             if not rows:
                 c1.execute(
                     """
-                    insert into documents values
-                    (Null, ?, ?, ?, ?)
+                    insert into documents(package, version, category, identifier)
+                    values (?, ?, ?, ?)
                     """,
-                    list(key),
+                    row,
                 )
                 source_id = c1.lastrowid
             else:
@@ -316,7 +1213,8 @@ class GraphStore:
         return source_id
 
     def _maybe_insert_dest(self, ref):
-        with self.conn:
+        with self._transaction():
+            row = self._encode_new(ref)
             c1 = self.conn.cursor()
             rows = list(
                 c1.execute(
@@ -327,7 +1225,7 @@ class GraphStore:
                 AND category=?
                 AND identifier=?)
                 """,
-                    list(ref),
+                    row,
                 )
             )
             if not rows:
@@ -336,7 +1234,7 @@ class GraphStore:
                     insert into destinations values
                     (Null, ?, ?, ?, ?)
                     """,
-                    list(ref),
+                    row,
                 )
                 dest_id = c1.lastrowid
             else:
@@ -344,22 +1242,106 @@ class GraphStore:
 
         return dest_id
 
-    def _meta_path(self, module: str, version: str):
+    def put_meta(self, module: str, version: str, data: bytes) -> None:
         assert isinstance(module, str)
         assert isinstance(version, str)
-        return self._root / module / version / "meta.cbor"
-
-    def put_meta(self, module: str, version: str, data: bytes) -> None:
         assert isinstance(data, bytes)
+        self._blobs.put_meta(module, version, data)
+        self._cache.invalidate(("meta", module, version))
 
-        mp = self._meta_path(module, version)
-        mp.path.parent.mkdir(parents=True, exist_ok=True)
+    def get_meta(self, key: Key) -> bytes:
+        return self._blobs.get_meta(key.module, key.version)
 
-        mp.write_bytes(data)
+    def _batch_source_id(self, key: Key) -> int:
+        assert self._batch is not None
+        if key not in self._batch.documents:
+            cur = self.conn.execute(
+                """
+                insert into documents(package, version, category, identifier)
+                values (?, ?, ?, ?)
+                """,
+                self._encode_new(key),
+            )
+            assert cur.lastrowid is not None
+            self._batch.documents[key] = cur.lastrowid
+        return self._batch.documents[key]
+
+    def _batch_dest_ids(self, refs: Set[Key]) -> Dict[Key, int]:
+        assert self._batch is not None
+        destinations = self._batch.destinations
+        missing = [r for r in refs if r not in destinations]
+        if missing:
+            self.conn.executemany(
+                """
+                insert into destinations values (NULL, ?, ?, ?, ?)
+                on conflict do nothing
+                """,
+                [self._encode_new(r) for r in missing],
+            )
+            for row in self.conn.execute(
+                "select * from destinations where id > ?",
+                (max(self._batch.rev_destinations, default=0),),
+            ):
+                k = self._decode(row[1:])
+                destinations[k] = row[0]
+                self._batch.rev_destinations[row[0]] = k
+            for r in missing:
+                if r not in destinations:
+                    # inserted concurrently by someone else before our
+                    # transaction started.
+                    [(dest_id,)] = self.conn.execute(
+                        """
+                        select id from destinations where (
+                            package=?
+                        AND version=?
+                        AND category=?
+                        AND identifier=?)
+                        """,
+                        self._encode_new(r),
+                    )
+                    destinations[r] = dest_id
+                    self._batch.rev_destinations[dest_id] = r
+        return {r: destinations[r] for r in refs}
+
+    def _update_in_degrees(self, added: List[int], removed: List[int]) -> None:
+        """
+        Update ``in_degrees`` for links added to and removed from the given
+        destination ids.
+        """
+        self.conn.executemany(
+            """
+            insert into in_degrees values (?, 1)
+            on conflict(dest) do update set n=n+1
+            """,
+            [(d,) for d in added],
+        )
+        self.conn.executemany(
+            "update in_degrees set n=n-1 where dest=?", [(d,) for d in removed]
+        )
 
-    def get_meta(self, key: Key) -> bytes:
-        mp = self._meta_path(key.module, key.version)
-        return mp.read_bytes()
+    def _put_links_batched(self, key: Key, new_refs: Set[Key]) -> None:
+        """
+        Update the links of ``key`` to be exactly ``new_refs``, using the
+        in-memory id maps of the current batch.
+        """
+        assert self._batch is not None
+        source_id = self._batch_source_id(key)
+        old_ids = {
+            dest
+            for (dest,) in self.conn.execute(
+                "select dest from links where source=?", (source_id,)
+            )
+        }
+        new_ids = set(self._batch_dest_ids(new_refs).values())
+        self.conn.executemany(
+            "insert into links values (?, ?)",
+            [(source_id, dest) for dest in new_ids - old_ids],
+        )
+        self.conn.executemany(
+            "delete from links where source=? and dest=?",
+            [(source_id, dest) for dest in old_ids - new_ids],
+        )
+        self._update_in_degrees(list(new_ids - old_ids), list(old_ids - new_ids))
 
     def put(self, key: Key, bytes_: bytes, refs) -> None:
         """
@@ -368,19 +1350,42 @@ class GraphStore:
 
         refs : List[Key] ?
 
+        The hash of ``bytes_`` is stored along with the document, and putting
+        the same bytes again is a no-op: nothing is written and the links are
+        not updated, so ``refs`` should be derived from ``bytes_``.
+
+        See Also
+        --------
+        batch, get_hash
         """
         assert isinstance(key, Key)
         for r in refs:
             assert isinstance(r, Key), r
-        path = self._key_to_path(key)
-        path.path.parent.mkdir(parents=True, exist_ok=True)
+        digest = content_hash(bytes_)
+
+        if self._batch is not None:
+            if self._batch.hashes.get(key) == digest:
+                return
+            self._invalidate(key)
+            self._blobs.put(key, bytes_)
+            self._put_links_batched(key, set(refs))
+            self.conn.execute(
+                "update documents set hash=? where id=?",
+                (digest, self._batch.documents[key]),
+            )
+            self._batch.hashes[key] = digest
+            return
+
+        if self.get_hash(key) == digest:
+            return
+        self._invalidate(key)
 
-        if "assets" not in key and path.exists():
+        if "assets" not in key and self._blobs.exists(key):
             old_refs = self.get_forwardrefs(key)
         else:
             old_refs = set()
 
-        path.write_bytes(bytes_)
+        self._blobs.put(key, bytes_)
 
         new_refs = set(refs)
         del refs
@@ -388,33 +1393,107 @@ class GraphStore:
         removed_refs = old_refs - new_refs
         added_refs = new_refs - old_refs
 
-        with self.conn:
+        with self._transaction():
             source_id = self._maybe_insert_source(key)
             params = []
             for ref in added_refs:
-                params.append((source_id, self._maybe_insert_dest(ref), "debug"))
+                params.append((source_id, self._maybe_insert_dest(ref)))
 
             to_del = []
             for ref in removed_refs:
                 to_del.append((source_id, self._maybe_insert_dest(ref)))
             c3 = self.conn.cursor()
-            c3.executemany("insert or ignore into links values (NULL, ?,?,?)", params)
+            c3.executemany("insert or ignore into links values (?, ?)", params)
             c3.executemany("delete from links where source=? and dest=? ", to_del)
+            self._update_in_degrees([d for _, d in params], [d for _, d in to_del])
+            c3.execute("update documents set hash=? where id=?", (digest, source_id))
 
-    def glob(self, pattern) -> List[Key]:
-        acc = ""
-        for p in pattern:
-            if p is None:
-                acc += "/*"
+    def get_hash(self, key: Key) -> Optional[str]:
+        """
+        Hash of the document stored at ``key`` (see `content_hash`).
+
+        It changes exactly when the document does, which makes it usable as an
+        HTTP ETag, or as the key of caches of what is computed from the
+        document.
+
+        Returns None if there is no such document, or if it has not been put
+        since hashes are recorded.
+        """
+        row = self._encode(key)
+        if row is None:
+            return None
+        for (digest,) in self._read_conn().execute(
+            """
+            select hash from documents where (
+                package=?
+            AND version=?
+            AND category=?
+            AND identifier=?)
+            """,
+            row,
+        ):
+            return digest
+        return None
+
+    def iglob(self, pattern) -> Iterator[Any]:
+        """
+        Iterate over the stored documents matching ``pattern``.
+
+        The documents are looked up in the ``documents`` table, not on
+        disk. Documents should not be put while iterating.
+
+        Parameters
+        ----------
+        pattern : tuple
+            1 to 4 items, each of them ``None`` to match any value. With 4
+            items yield the matching `Key`; with less, yield the distinct
+            matching prefixes as tuples; for example ``(None, None)`` yields
+            all the ``(package, version)`` pairs.
+
+        See Also
+        --------
+        glob, reindex
+        """
+        # package, version and category are stored as ids.
+        encoded = [
+            p if p is None or i == 3 else self._name_id(p)
+            for i, p in enumerate(pattern)
+        ]
+        if any(e is None and p is not None for e, p in zip(encoded, pattern)):
+            return
+        query, params, n = _glob_query("documents", encoded)
+        for row in self._read_conn().execute(query, params):
+            if n == 4:
+                yield self._decode(row)
             else:
-                acc += "/" + p
-        acc = acc[1:]
-        try:
-            res = [
-                self._path_to_key(p)
-                for p in self._root.glob(acc)
-                if not p.name.endswith(".br")
-            ]  # !!
-        except Exception as e:
-            raise type(e)("Acc:" + acc, pattern)
-        return res
+                yield tuple(map(self._name, row))
+
+    def glob(self, pattern) -> List[Any]:
+        """
+        Same as `iglob`, but return a list.
+        """
+        return list(self.iglob(pattern))
+
+    def reindex(self) -> Tuple[int, int]:
+        """
+        Repair the ``documents`` table, by comparing it with what is actually
+        in the storage.
+
+        Documents found in the storage and missing from the table are added
+        (without links, relink to find those), and entries for which the
+        storage has no document are removed.
+
+        Returns
+        -------
+        added : int
+        removed : int
+        """
+        stored = set(self._blobs.glob((None, None, None, None)))
+        indexed = set(self.iglob((None, None, None, None)))
+        with self._transaction():
+            for key in stored - indexed:
+                self._maybe_insert_source(key)
+        for key in indexed - stored:
+            self._invalidate(key)
+            self._remove_source(key)
+        return len(stored - indexed), len(indexed - stored)
@@ -72,7 +72,9 @@ from typing import get_type_hints as gth
 base_types = {int, str, bool, type(None)}
 
 
-@lru_cache(50)
+# unbounded: there are more node classes than a small cache would hold, and
+# resolving the annotations again each time is slow.
+@lru_cache(None)
 def get_type_hints(type_):
     return gth(type_)
 
@@ -118,7 +120,7 @@ def serialize(instance, annotation):
             ann_ = ma[0]
             return {"type": ann_.__name__, "data": serialize(instance, ann_)}
         elif (
-            (type(annotation) is type)
+            isinstance(annotation, type)
             and type.__module__ not in ("builtins", "typing")
             and (instance.__class__.__name__ == getattr(annotation, "_name", None))
             or type(instance) == annotation
@@ -212,7 +214,7 @@ def deserialize(type_, annotation, data):
             return deserialize(real_type, real_type, data_)
         else:
             assert False
-    elif (type(annotation) is type) and annotation.__module__ not in (
+    elif isinstance(annotation, type) and annotation.__module__ not in (
         "builtins",
         "typing",
     ):
@@ -3,8 +3,11 @@ Misc helper functions
 """
 
 import io
+import multiprocessing
+import os
 import sys
 import ast
+import traceback
 
 from rich.progress import Progress
 
@@ -73,6 +76,17 @@ class BlockExecutor:
 
         return _pylab_helpers.Gcf.get_all_fig_managers()
 
+    def close_figs(self):
+        import matplotlib.pyplot as plt
+
+        plt.close("all")
+
+    def call(self, func, *args):
+        """
+        Call ``func`` with the namespace of the examples and ``args``.
+        """
+        return func(self.ns, *args)
+
     def get_figs(self):
         figs = []
         for fig_man in self.fig_man():
@@ -118,3 +132,196 @@ class BlockExecutor:
         stdout.seek(0)
         stderr.seek(0)
         return res, fig_managers, stdout.read(), stderr.read()
+
+
+class _RemoteTraceback(Exception):
+    """
+    Traceback of an exception raised in a `SandboxedExecutor` process, set as
+    the cause of the exception re-raised in the parent.
+    """
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _limit_address_space(memory):
+    """
+    Limit the address space of the current process to ``memory`` bytes more
+    than it currently uses.
+
+    A forked process starts with the address space of its parent, which can be
+    several GB once scientific libraries are loaded, so an absolute limit
+    would not mean much. This does nothing where the size of the address
+    space is not known, which is outside of Linux.
+    """
+    import resource
+
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[0])
+    except OSError:
+        return
+    limit = pages * resource.getpagesize() + memory
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _sandbox_main(conn, ns, memory):
+    """
+    Serve the requests of a `SandboxedExecutor` with a `BlockExecutor`.
+
+    Figure managers are sent as their figure numbers, and values captured by
+    the displayhook as their repr.
+    """
+    executor = BlockExecutor(ns)
+    if memory is not None:
+        _limit_address_space(memory)
+    while True:
+        try:
+            op, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            if op == "exec":
+                text, name = args
+                res, fig_managers, out, err = executor.exec(text, name=name)
+                reply = (
+                    None if res is None else repr(res),
+                    [m.num for m in fig_managers],
+                    out,
+                    err,
+                )
+            elif op == "fig_man":
+                reply = [m.num for m in executor.fig_man()]
+            elif op == "get_figs":
+                reply = executor.get_figs()
+            elif op == "call":
+                reply = executor.call(*args)
+            else:
+                assert op == "close_figs", op
+                reply = executor.close_figs()
+            conn.send(("ok", reply))
+        except BaseException as e:
+            tb = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            try:
+                conn.send(("error", (e, tb)))
+            except Exception:
+                # the exception can not be pickled.
+                conn.send(("error", (RuntimeError(repr(e)), tb)))
+
+
+class SandboxedExecutor:
+    """
+    A `BlockExecutor` running in a forked process, so that an example which
+    hangs, crashes or uses too much memory does not take the whole build down.
+
+    The process is forked on first use, and inherits the namespace ``ns``.
+    Each request waits at most ``timeout`` seconds for the process, which is
+    then killed and a TimeoutError raised; ``memory`` limits how much the
+    address space of the process may grow once it is set up, in bytes, so
+    that examples allocating more fail with MemoryError. None or 0 is no
+    limit. After the process is
+    killed or dies, a ChildProcessError is raised and the next request forks
+    a new one, starting again from ``ns``.
+
+    Unlike `BlockExecutor.exec`, `exec` returns the repr of the value captured
+    by the displayhook, and the numbers of the open figures instead of their
+    managers. On platforms without ``fork``, examples run in the current
+    process.
+    """
+
+    def __init__(self, ns, *, timeout=None, memory=None):
+        self.ns = ns
+        # 0 is no limit too, as None can not be written in toml.
+        self.timeout = timeout or None
+        self.memory = memory or None
+        self._proc = None
+        self._conn = None
+
+    def _start(self):
+        ctx = multiprocessing.get_context("fork")
+        self._conn, child_conn = ctx.Pipe()
+        self._proc = ctx.Process(
+            target=_sandbox_main, args=(child_conn, self.ns, self.memory), daemon=True
+        )
+        self._proc.start()
+        child_conn.close()
+
+    def _stop(self):
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.join()
+            self._conn.close()
+        self._proc = None
+        self._conn = None
+
+    def _died(self):
+        proc = self._proc
+        self._stop()
+        return ChildProcessError(
+            f"Example execution process died (exit code {proc.exitcode})"
+        )
+
+    def _call(self, op, *args):
+        if self._proc is None:
+            self._start()
+        try:
+            self._conn.send((op, args))
+        except OSError:
+            raise self._died() from None
+        if not self._conn.poll(self.timeout):
+            self._stop()
+            raise TimeoutError(f"Example did not finish in {self.timeout} seconds")
+        try:
+            status, value = self._conn.recv()
+        except (EOFError, OSError):
+            raise self._died() from None
+        if status == "error":
+            exc, tb = value
+            raise exc from _RemoteTraceback(tb)
+        return value
+
+    def __enter__(self):
+        assert (len(self.fig_man())) == 0, f"init fail in {len(self.fig_man())}"
+
+    def __exit__(self, *args, **kwargs):
+        self._stop()
+
+    def fig_man(self):
+        if self._proc is None:
+            return []
+        return self._call("fig_man")
+
+    def get_figs(self):
+        if self._proc is None:
+            return []
+        return self._call("get_figs")
+
+    def close_figs(self):
+        if self._proc is not None:
+            self._call("close_figs")
+
+    def call(self, func, *args):
+        """
+        Call ``func`` with the namespace of the examples and ``args`` in the
+        process, if it is running; ``func``, ``args`` and the result are
+        pickled.
+        """
+        if self._proc is None:
+            return func(self.ns, *args)
+        return self._call("call", func, *args)
+
+    def exec(self, text, *, name="<papyri>"):
+        return self._call("exec", text, name)
+
+
+def make_executor(ns, *, timeout=None, memory=None):
+    """
+    A `SandboxedExecutor` for ``ns``, or a `BlockExecutor` where processes can
+    not be forked.
+    """
+    if hasattr(os, "fork"):
+        return SandboxedExecutor(ns, timeout=timeout, memory=memory)
+    return BlockExecutor(ns)
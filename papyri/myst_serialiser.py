@@ -12,7 +12,8 @@ This is a prototype of serializer that respect this layout.
 
 
 from typing import Union
-from typing import get_type_hints as gth
+
+from .miniserde import get_type_hints as gth
 
 base_types = {int, str, bool, type(None)}
 
@@ -57,7 +58,7 @@ def serialize(instance, annotation):
             return {**serialized_data, "type": type_}
         return {"data": serialized_data, "type": type_}
     if (
-        (type(annotation) is type)
+        isinstance(annotation, type)
         and type.__module__ not in ("builtins", "typing")
         and (instance.__class__.__name__ == getattr(annotation, "__name__", None))
         or type(instance) == annotation
@@ -0,0 +1,348 @@
+"""
+Pack-file storage for the GraphStore.
+
+Storing one file per document means a full ingest of a few libraries creates
+hundreds of thousands of tiny files, which is slow to glob, copy and back up.
+
+Here, documents of a given package and version are appended to a few large
+*segment* files::
+
+    <root>/<module>/<version>/00000.pack
+    <root>/<module>/<version>/00001.pack
+    <root>/<module>/<version>/meta.cbor
+
+and the location of each document (segment, start, length) is kept in a
+``blobs`` table of the graphstore sqlite database, so that the index is updated
+in the same transaction as the links. Like the other tables, it refers to the
+package, version and category strings by their id in the ``names`` table.
+
+Overwriting a document appends a new copy and updates the index; the previous
+copy becomes garbage until its segment is compacted with `PackStore.compact`.
+
+Reads go through a read-only ``mmap`` of each segment, so that
+`PackStore.get_view` can hand out slices of the page cache to the decoder
+without an ``open``/``read`` and a copy per document.
+"""
+
+import mmap
+import sqlite3
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from .graphstore import GraphStore, Key, _glob_query
+
+# segments are not grown past this size, a new one is started instead.
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+class PackStore:
+    """
+    Store documents in append-only pack files, with an offset index in sqlite.
+
+    This has the same interface as `papyri.graphstore.FileStore`.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        conn: sqlite3.Connection,
+        names: "GraphStore",
+        *,
+        segment_size=SEGMENT_SIZE,
+        reader: Optional[Callable[[], sqlite3.Connection]] = None,
+    ):
+        """
+        Parameters
+        ----------
+        root : Path
+            directory in which to create the segments.
+        conn : Connection
+            sqlite connection in which to store the index.
+        names : GraphStore
+            store whose ``names`` table the package, version and category of
+            the index refer to.
+        segment_size : int
+            size (in bytes) above which we start a new segment.
+        reader : callable
+            returns the connection to use for lookups in the current thread,
+            defaults to ``conn``.
+        """
+        assert isinstance(root, Path)
+        self._root = root
+        self._root.mkdir(parents=True, exist_ok=True)
+        self.conn = conn
+        self._names = names
+        self._reader = reader or (lambda: conn)
+        self._segment_size = segment_size
+        # (module, version) -> (segment number, file opened for appending)
+        self._writers: Dict[Tuple[str, str], Tuple[int, BinaryIO]] = {}
+        # segment path -> read only map of it, remapped when the segment grew.
+        self._maps: Dict[Path, mmap.mmap] = {}
+        with self.conn:
+            self.conn.execute("BEGIN")
+            columns = {
+                name: type_
+                for _, name, type_, *_ in self.conn.execute("PRAGMA table_info(blobs)")
+            }
+            if columns.get("package") == "TEXT":
+                self._migrate()
+            else:
+                self._create_tables()
+
+    def _create_tables(self) -> None:
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blobs(
+            package INTEGER NOT NULL REFERENCES names(id),
+            version INTEGER NOT NULL REFERENCES names(id),
+            category INTEGER NOT NULL REFERENCES names(id),
+            identifier TEXT NOT NULL,
+            segment INTEGER NOT NULL,
+            start INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            PRIMARY KEY (package, version, category, identifier))
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS bsx on blobs(package, version, segment);"
+        )
+
+    def _migrate(self) -> None:
+        """
+        Convert an index storing the package, version and category strings in
+        each row to ids of the ``names`` table.
+        """
+        print("Migrating pack index to interned names")
+        self.conn.execute("ALTER TABLE blobs RENAME TO old_blobs")
+        self.conn.execute("DROP INDEX IF EXISTS bsx")
+        self._create_tables()
+        for column in ["package", "version", "category"]:
+            self.conn.execute(
+                f"insert or ignore into names(name) select {column} from old_blobs"
+            )
+        self.conn.execute(
+            """
+            insert into blobs
+            select p.id, v.id, c.id, old.identifier, old.segment, old.start, old.length
+            from old_blobs as old
+                inner join names as p on p.name=old.package
+                inner join names as v on v.name=old.version
+                inner join names as c on c.name=old.category
+            """
+        )
+        self.conn.execute("DROP TABLE old_blobs")
+
+    def _segment_path(self, module: str, version: str, segment: int) -> Path:
+        return self._root / module / version / f"{segment:05d}.pack"
+
+    def _open_writer(self, module: str, version: str, segment: int) -> None:
+        if (module, version) in self._writers:
+            self._writers[(module, version)][1].close()
+        path = self._segment_path(module, version, segment)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._writers[(module, version)] = (segment, path.open("ab"))
+
+    def _writer(self, module: str, version: str, size: int) -> Tuple[int, BinaryIO]:
+        """
+        Get the segment number and file to append ``size`` bytes to for the
+        given package and version, starting a new segment if the current one
+        is full.
+        """
+        if (module, version) not in self._writers:
+            existing = sorted((self._root / module / version).glob("*.pack"))
+            self._open_writer(
+                module, version, int(existing[-1].stem) if existing else 0
+            )
+        segment, f = self._writers[(module, version)]
+        if f.tell() and f.tell() + size > self._segment_size:
+            self._open_writer(module, version, segment + 1)
+        return self._writers[(module, version)]
+
+    def _locate(self, key: Key) -> Tuple[int, int, int]:
+        row = self._names._encode(key)
+        rows = (
+            []
+            if row is None
+            else list(
+                self._reader().execute(
+                    """
+                select segment, start, length from blobs where (
+                    package=?
+                AND version=?
+                AND category=?
+                AND identifier=?)
+                """,
+                    row,
+                )
+            )
+        )
+        if not rows:
+            raise FileNotFoundError(f"No such document {key}")
+        [(segment, start, length)] = rows
+        return segment, start, length
+
+    def _map(self, path: Path, end: int) -> mmap.mmap:
+        """
+        Return a map of the segment at ``path`` covering at least ``end`` bytes.
+        """
+        m = self._maps.get(path)
+        if m is None or len(m) < end:
+            # we don't close the previous map, views of it may still be alive;
+            # it will be released with the last of them.
+            with path.open("rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = m
+        return m
+
+    def get_view(self, key: Key) -> memoryview:
+        """
+        Zero-copy view of the document bytes.
+
+        The view stays valid even if the segment is compacted away later on.
+        """
+        segment, start, length = self._locate(key)
+        if length == 0:
+            return memoryview(b"")
+        path = self._segment_path(key.module, key.version, segment)
+        try:
+            m = self._map(path, start + length)
+        except FileNotFoundError:
+            # compacted (by another process) since we located it; the index
+            # is updated before the segment is deleted.
+            segment, start, length = self._locate(key)
+            path = self._segment_path(key.module, key.version, segment)
+            m = self._map(path, start + length)
+        return memoryview(m)[start : start + length]
+
+    def get(self, key: Key) -> bytes:
+        return bytes(self.get_view(key))
+
+    def put(self, key: Key, data: bytes) -> None:
+        assert None not in key, key
+        segment, f = self._writer(key.module, key.version, len(data))
+        start = f.tell()
+        f.write(data)
+        # we do not fsync, but we want readers to see the data.
+        f.flush()
+        self.conn.execute(
+            """
+            insert into blobs values (?, ?, ?, ?, ?, ?, ?)
+            on conflict(package, version, category, identifier) do update set
+                segment=excluded.segment,
+                start=excluded.start,
+                length=excluded.length
+            """,
+            [*self._names._encode_new(key), segment, start, len(data)],
+        )
+
+    def exists(self, key: Key) -> bool:
+        try:
+            self._locate(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def remove(self, key: Key) -> None:
+        self._locate(key)
+        row = self._names._encode(key)
+        assert row is not None
+        self.conn.execute(
+            """
+            delete from blobs where (
+                package=?
+            AND version=?
+            AND category=?
+            AND identifier=?)
+            """,
+            row,
+        )
+
+    def _meta_path(self, module: str, version: str) -> Path:
+        return self._root / module / version / "meta.cbor"
+
+    def put_meta(self, module: str, version: str, data: bytes) -> None:
+        mp = self._meta_path(module, version)
+        mp.parent.mkdir(parents=True, exist_ok=True)
+        mp.write_bytes(data)
+
+    def get_meta(self, module: str, version: str) -> bytes:
+        return self._meta_path(module, version).read_bytes()
+
+    def glob(self, pattern) -> List[Any]:
+        """
+        Find all the stored keys matching pattern.
+
+        Same as `FileStore.glob`, ``None`` in ``pattern`` match any value; if
+        pattern has less than 4 items we return the distinct matching
+        prefixes as tuples.
+        """
+        names = self._names
+        encoded = [
+            p if p is None or i == 3 else names._name_id(p)
+            for i, p in enumerate(pattern)
+        ]
+        if any(e is None and p is not None for e, p in zip(encoded, pattern)):
+            return []
+        query, params, n = _glob_query("blobs", encoded)
+        rows = self._reader().execute(query, params)
+        if n == 4:
+            return [names._decode(row) for row in rows]
+        return [tuple(map(names._name, row)) for row in rows]
+
+    def compact(self, threshold: float = 0.5) -> int:
+        """
+        Rewrite the segments in which more than ``threshold`` of the bytes
+        belong to superseded documents.
+
+        The live documents of those segments are appended to a new segment of
+        their package, the index is updated and the old segments are deleted.
+
+        Returns
+        -------
+        reclaimed : int
+            number of bytes freed.
+        """
+        reclaimed = 0
+        paths = sorted(self._root.glob("*/*/*.pack"))
+        # (module, version) -> last segment before compaction.
+        last: Dict[Tuple[str, str], int] = {}
+        for path in paths:
+            package = (path.parent.parent.name, path.parent.name)
+            last[package] = max(last.get(package, 0), int(path.stem))
+        for path in paths:
+            module, version = path.parent.parent.name, path.parent.name
+            segment = int(path.stem)
+            size = path.stat().st_size
+            ids = (self._names._name_id(module), self._names._name_id(version))
+            [(live,)] = self.conn.execute(
+                """
+                select coalesce(sum(length), 0) from blobs
+                where package=? AND version=? AND segment=?
+                """,
+                (*ids, segment),
+            )
+            if size == 0 or (size - live) / size <= threshold:
+                continue
+            # never append to a segment that may be compacted (and deleted),
+            # whether or not this process had it open already.
+            current = self._writers.get((module, version), (-1,))[0]
+            if current <= last[(module, version)]:
+                self._open_writer(module, version, last[(module, version)] + 1)
+            with self.conn, path.open("rb") as f:
+                for category, identifier, start, length in list(
+                    self.conn.execute(
+                        """
+                        select category, identifier, start, length from blobs
+                        where package=? AND version=? AND segment=?
+                        order by start
+                        """,
+                        (*ids, segment),
+                    )
+                ):
+                    f.seek(start)
+                    key = Key(module, version, self._names._name(category), identifier)
+                    self.put(key, f.read(length))
+            path.unlink()
+            self._maps.pop(path, None)
+            reclaimed += size - live
+        return reclaimed
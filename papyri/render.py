@@ -1,6 +1,7 @@
 import builtins
 import json
 import logging
+import mimetypes
 import operator
 import os
 import random
@@ -10,21 +11,22 @@ from collections import OrderedDict, defaultdict
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Set, Any, Dict, List, Callable
+from typing import Optional, Any, Dict, List, Callable
 
 from flatlatex import converter
 from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
 from pygments.formatters import HtmlFormatter
-from quart import send_from_directory, Response, redirect
+from quart import send_from_directory, Response, redirect, request
 from quart_trio import QuartTrio
 from rich.logging import RichHandler
 import minify_html
+import trio
 
 from . import config as default_config
 from . import take2
 from .config import ingest_dir
 from .crosslink import IngestedBlobs, RefInfo, find_all_refs
-from .graphstore import GraphStore, Key
+from .graphstore import DecodedCache, GraphStore, Key, content_hash
 from .myst_ast import MLink, MText
 from .take2 import RefInfo, encoder, Section
 from .tree import TreeReplacer, TreeVisitor
@@ -40,6 +42,9 @@ log = logging.getLogger("papyri")
 
 CSS_DATA = HtmlFormatter(style="pastie").get_style_defs(".highlight")
 
+# bytes of rendered api pages kept in memory by the server.
+PAGE_CACHE_SIZE = 32 * 1024 * 1024
+
 
 def minify(s):
     return minify_html.minify(
@@ -218,62 +223,27 @@ def cs2(ref, tree, ref_map):
     return siblings
 
 
-def compute_graph(
-    gs: GraphStore, backrefs: Set[Key], refs: Set[Key], key: Key
-) -> Dict[Any, Any]:
+def compute_graph(gs: GraphStore, key: Key) -> Dict[Any, Any]:
     """
     Compute local reference graph for a given item.
 
     gs: Graphstore
         the graphstore to get data out of.
-    backrefs:
-        list of backreferences
-    refs:
-        list of forward references
     keys:
         current iten
 
     """
-    weights = {}
-    assert isinstance(backrefs, set)
-    for b in backrefs:
-        assert isinstance(b, Key)
-    assert isinstance(refs, set)
-    for f in refs:
-        assert isinstance(f, Key)
-
-    all_nodes = set(backrefs).union(set(refs))
-    # all_nodes = set(Key(*k) for k in all_nodes)
-
-    raw_edges = []
-    for k in set(all_nodes):
-        name = tuple(k)[3]
-        neighbors_refs = gs.get_backref(k)
-        weights[name] = len(neighbors_refs)
-        orig = [x[3] for x in neighbors_refs]
-        all_nodes = all_nodes.union(neighbors_refs)
-        for o in orig:
-            raw_edges.append((k.path, o))
+    key_weights, key_edges = gs.get_neighbourhood(key, max_nodes=50)
+
+    weights: Dict[str, int] = {}
+    for k, w in key_weights.items():
+        weights[k.path] = max(w, weights.get(k.path, 0))
+    edges = [(k.path, o.path) for k, o in key_edges]
+    all_nodes = set(key_weights).union(o for _, o in key_edges)
 
     data: Dict[str, List[Any]] = {"nodes": [], "links": []}
 
-    if len(weights) > 50:
-        for thresh in sorted(set(weights.values())):
-            log.debug("%s items ; remove items %s or lower", len(weights), thresh)
-            weights = {k: v for k, v in weights.items() if v > thresh}
-            log.debug("down to %s items", len(weights))
-            if len(weights) < 50:
-                break
-
-    all_nodes = set(all_nodes)
-    nums_ = set()
-    edges = list(raw_edges)
     nodes = list(set(weights.keys()))
-    for a, b in edges:
-        if (a not in nodes) or (b not in nodes):
-            continue
-        nums_.add(a)
-        nums_.add(b)
     nums = {x: i for i, x in enumerate(nodes, start=1)}
 
     for i, (from_, to) in enumerate(edges):
@@ -338,12 +308,14 @@ class HtmlRenderer:
         self.env.globals["sidebar"] = sidebar
         self.env.globals["dothtml"] = suf
         self.env.globals["uuid"] = lambda: uuid.uuid4().hex
+        # rendered api pages, by ETag.
+        self._pages = DecodedCache(PAGE_CACHE_SIZE)
 
     async def index(self):
         keys = self.store.glob((None, None, "meta", "aliases.cbor"))
         data = []
         for k in keys:
-            meta = encoder.decode(self.store.get_meta(k))
+            meta = self.store.get_meta_decoded(k, encoder.decode)
             data.append((k.module, k.version, meta["logo"]))
 
         return self.env.get_template("index.tpl.j2").render(data=data)
@@ -362,7 +334,7 @@ class HtmlRenderer:
         for it in items:
             if it.kind in ("assets", "examples", "meta"):
                 continue
-            data = self.store.get(it)
+            data = self.store.get_view(it)
             try:
                 obj = encoder.decode(data)
             except Exception:
@@ -429,8 +401,8 @@ class HtmlRenderer:
         figmap = defaultdict(lambda: [])
         assert isinstance(self.store, GraphStore)
         if package is not None:
-            meta = encoder.decode(
-                self.store.get_meta(Key(package, version, None, None))
+            meta = self.store.get_meta_decoded(
+                Key(package, version, None, None), encoder.decode
             )
         else:
             meta = {"logo": None}
@@ -442,7 +414,7 @@ class HtmlRenderer:
             backrefs = backrefs.union(brs)
 
         for key in backrefs:
-            data = encoder.decode(self.store.get(Key(*key)))
+            data = self.store.get_decoded(Key(*key), encoder.decode)
             if "examples" in key:
                 continue
             # TODO: examples can actuallly be just Sections.
@@ -461,7 +433,7 @@ class HtmlRenderer:
 
         glist = self.store.glob((package, version, "examples", None))
         for target_key in glist:
-            section = encoder.decode(self.store.get(target_key))
+            section = self.store.get_decoded(target_key, encoder.decode)
 
             for k in [
                 u.value for u in section.children if u.__class__.__name__ == "Fig"
@@ -499,13 +471,15 @@ class HtmlRenderer:
     async def _get_toc_for(self, package, version):
         keys = self.store.glob((package, version, "meta", "toc.cbor"))
         assert len(keys) == 1
-        data = self.store.get(keys[0])
+        data = self.store.get_view(keys[0])
         return encoder.decode(data)
 
     async def _list_narative(self, package: str, version: str, ext=""):
         toctrees = await self._get_toc_for(package, version)
 
-        meta = encoder.decode(self.store.get_meta(Key(package, version, None, None)))
+        meta = self.store.get_meta_decoded(
+            Key(package, version, None, None), encoder.decode
+        )
         logo = meta["logo"]
 
         class D:
@@ -530,9 +504,9 @@ class HtmlRenderer:
         """
         # return "Not Implemented"
         key = Key(package, version, "docs", ref)
-        bytes = self.store.get(key)
-        doc_blob = encoder.decode(bytes)
-        meta = encoder.decode(self.store.get_meta(key))
+        # render_one modifies the document, so it gets its own copy.
+        doc_blob = encoder.decode(self.store.get_view(key))
+        meta = self.store.get_meta_decoded(key, encoder.decode)
         # return "OK"
 
         template = self.env.get_template("html.tpl.j2")
@@ -575,33 +549,88 @@ class HtmlRenderer:
             toctrees=toctrees,
         )
 
-    async def _route_data(self, ref, version, known_refs):
+    @staticmethod
+    def _api_key(ref, version) -> Key:
         root = ref.split("/")[0].split(".")[0]
-        key = Key(root, version, "module", ref)
-        gbytes, backward, forward = self.store.get_all(key)
+        return Key(root, version, "module", ref)
+
+    def _route_data(self, ref, version, known_refs):
+        key = self._api_key(ref, version)
+        # render_one reifies the links of the document in place, possibly in
+        # several threads at once, so each rendering gets its own copy instead
+        # of the one shared through the decoded cache; the rendered pages are
+        # cached instead (see _render_api_cached).
+        doc_blob = encoder.decode(self.store.get_view(key))
+        backward = self.store.get_backref(key)
+        forward = self.store.get_forwardrefs(key)
         x_, y_ = find_all_refs(self.store)
-        doc_blob = encoder.decode(gbytes)
         return x_, y_, doc_blob, backward, forward
 
+    def api_etag(self, ref, version) -> Optional[str]:
+        """
+        ETag of the api page ``ref``, or None if there is no such document.
+
+        The page is rendered from the document, the metadata of its package
+        and the documents referencing it, and the ETag changes when any of them
+        does. Links are resolved against all the documents of the store, and
+        the page shows their reference graph: the ETag also changes with the
+        `GraphStore.generation` of the store, so after each ingest.
+        """
+        key = self._api_key(ref, version)
+        digest = self.store.get_hash(key)
+        if digest is None:
+            return None
+        meta = content_hash(self.store.get_meta(key))
+        backrefs = sorted(self.store.get_backref(key))
+        generation = self.store.generation()
+        sidebar = self.env.globals["sidebar"]
+        return content_hash(
+            repr((digest, meta, backrefs, generation, sidebar)).encode()
+        )
+
     async def _route(
         self,
         ref,
         version=None,
+        etag=None,
     ):
+        """
+        Render the api page ``ref`` in a worker thread, so that the store
+        queries and the rendering of concurrent requests do not block the
+        event loop; the store gives each worker thread its own read-only
+        connection.
+
+        With an ``etag`` (see `api_etag`), the rendered page is cached under
+        it.
+        """
+        if etag is None:
+            return await trio.to_thread.run_sync(self._render_api, ref, version)
+        return await trio.to_thread.run_sync(
+            self._render_api_cached, ref, version, etag
+        )
+
+    def _render_api_cached(self, ref, version, etag):
+        def load():
+            page = self._render_api(ref, version)
+            return page, len(page)
+
+        return self._pages.get(etag, load)
+
+    def _render_api(self, ref, version):
         assert not ref.endswith(".html")
         assert version is not None
         assert ref != ""
 
         template = self.env.get_template("html.tpl.j2")
         root = ref.split(".")[0]
-        meta = encoder.decode(self.store.get_meta(Key(root, version, None, None)))
+        meta = self.store.get_meta_decoded(
+            Key(root, version, None, None), encoder.decode
+        )
 
         known_refs, ref_map = find_all_refs(self.store)
 
         # technically incorrect we don't load backrefs
-        x_, y_, doc_blob, backward, forward = await self._route_data(
-            ref, version, known_refs
-        )
+        x_, y_, doc_blob, backward, forward = self._route_data(ref, version, known_refs)
         assert x_ == known_refs
         assert y_ == ref_map
         assert version is not None
@@ -614,9 +643,7 @@ class HtmlRenderer:
             # we will now just render it.
             assert root is not None
             # assert version is not None
-            data = compute_graph(
-                self.store, backward, forward, Key(root, version, "module", ref)
-            )
+            data = compute_graph(self.store, Key(root, version, "module", ref))
             json_str = json.dumps(data)
             parts_links = {}
             acc = ""
@@ -655,6 +682,7 @@ class HtmlRenderer:
         template = self.env.get_template("html.tpl.j2")
         gfiles = list(self.store.glob((None, None, "module", None)))
         random.shuffle(gfiles)
+        all_backrefs = self.store.get_backrefs_many(gfiles)
         for _, key in progress(gfiles, description="Rendering API..."):
             module, version = key.module, key.version
             if config.ascii:
@@ -666,14 +694,15 @@ class HtmlRenderer:
                     tree=tree,
                     known_refs=known_refs,
                     ref_map=ref_map,
+                    backrefs=all_backrefs[key],
                 )
                 backward_r = [RefInfo(*x) for x in backward]
                 if graph:
-                    data = compute_graph(self.store, set(backward), set(forward), key)
+                    data = compute_graph(self.store, key)
                 else:
                     data = {}
                 json_str = json.dumps(data)
-                meta = encoder.decode(self.store.get_meta(key))
+                meta = self.store.get_meta_decoded(key, encoder.decode)
                 data = render_one(
                     current_type="API",
                     template=template,
@@ -766,8 +795,17 @@ class HtmlRenderer:
                     toc
                 )
 
+    async def img(self, package, version, subpath=None) -> Response:
+        """
+        Serve an asset from the store, whichever storage backs it.
+        """
+        data = self.store.get(Key(package, version, "assets", subpath))
+        return Response(data, mimetype=mimetypes.guess_type(subpath)[0])
+
     async def examples_handler(self, package, version, subpath):
-        meta = encoder.decode(self.store.get_meta(Key(package, version, None, None)))
+        meta = self.store.get_meta_decoded(
+            Key(package, version, None, None), encoder.decode
+        )
 
         pap_keys = self.store.glob((None, None, "meta", "aliases.cbor"))
         parts = {package: []}
@@ -775,9 +813,9 @@ class HtmlRenderer:
             mod, ver, _, _ = pk
             parts[package].append((RefInfo(mod, ver, "api", mod), mod))
 
-        bytes_ = self.store.get(Key(package, version, "examples", subpath))
-
-        ex = encoder.decode(bytes_)
+        ex = self.store.get_decoded(
+            Key(package, version, "examples", subpath), encoder.decode
+        )
         assert isinstance(ex, Section)
 
         class Doc:
@@ -799,7 +837,9 @@ class HtmlRenderer:
 
     async def render_single_examples(self, module, version, *, ext, data):
         mod_vers = self.store.glob((None, None))
-        meta = encoder.decode(self.store.get_meta(Key(module, version, None, None)))
+        meta = self.store.get_meta_decoded(
+            Key(module, version, None, None), encoder.decode
+        )
         logo = meta["logo"]
         parts = {module: []}
         for mod, ver in mod_vers:
@@ -827,11 +867,6 @@ class HtmlRenderer:
         )
 
 
-async def img(package, version, subpath=None) -> Response:
-    folder = ingest_dir / package / version / "assets"
-    return await send_from_directory(folder, subpath)
-
-
 def static(name) -> Callable[[], bytes]:
     here = Path(os.path.dirname(__file__))
     static = here / "static"
@@ -848,10 +883,13 @@ def pygment_css() -> Response:
     return Response(CSS_DATA, mimetype="text/css")
 
 
-def serve(*, sidebar: bool, port=1234):
+def serve(*, sidebar: bool, port=1234, cache_size=None):
     app = QuartTrio(__name__)
 
-    gstore = GraphStore(ingest_dir)
+    if cache_size is None:
+        gstore = GraphStore(ingest_dir)
+    else:
+        gstore = GraphStore(ingest_dir, cache_size=cache_size)
     prefix = "/p/"
     html_renderer = HtmlRenderer(
         gstore, sidebar=sidebar, prefix=prefix, trailing_html=False
@@ -864,7 +902,14 @@ def serve(*, sidebar: bool, port=1234):
             version = res[0][1]
             return redirect(f"{prefix}{package}/{version}/api/{ref}")
             # print(list(html_renderer.store.glob(
-        return await html_renderer._route(ref, version)
+        etag = await trio.to_thread.run_sync(html_renderer.api_etag, ref, version)
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            response = Response("", status=304)
+        else:
+            response = Response(await html_renderer._route(ref, version, etag))
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+        return response
 
     async def g(module):
         return await html_renderer.gallery(module)
@@ -872,6 +917,9 @@ def serve(*, sidebar: bool, port=1234):
     async def gr():
         return await html_renderer.gallery("*", "*")
 
+    async def cache_info():
+        return gstore.cache_info()._asdict()
+
     app.route("/logo.png")(static("papyri-logo.png"))
     app.route("/favicon.ico")(static("favicon.ico"))
     app.route("/papyri.css")(static("papyri.css"))
@@ -879,7 +927,7 @@ def serve(*, sidebar: bool, port=1234):
     app.route("/graph_canvas.js")(static("graph_canvas.js"))
     app.route("/graph_svg.js")(static("graph_svg.js"))
     # sub here is likely incorrect
-    app.route(f"{prefix}<package>/<version>/img/<path:subpath>")(img)
+    app.route(f"{prefix}<package>/<version>/img/<path:subpath>")(html_renderer.img)
     app.route(f"{prefix}<package>/<version>/examples/<path:subpath>")(
         html_renderer.examples_handler
     )
@@ -895,6 +943,7 @@ def serve(*, sidebar: bool, port=1234):
     app.route(f"{prefix}/gallery/<module>")(g)
     app.route(f"{prefix}/virtual/<module>/<node>")(html_renderer.virtual)
     app.route("/")(html_renderer.index)
+    app.route("/cache_info")(cache_info)
     port = int(os.environ.get("PORT", port))
     print("Seen config port ", port)
     prod = os.environ.get("PROD", None)
@@ -1060,8 +1109,8 @@ async def _ascii_render(key: Key, store: GraphStore, known_refs=None, template=N
 
     env, template = _ascii_env()
 
-    doc_blob = encoder.decode(store.get(key))
-    meta = encoder.decode(store.get_meta(key))
+    doc_blob = encoder.decode(store.get_view(key))
+    meta = store.get_meta_decoded(key, encoder.decode)
 
     # exercise the reprs
     assert str(doc_blob)
@@ -1080,13 +1129,15 @@ async def _ascii_render(key: Key, store: GraphStore, known_refs=None, template=N
 
 
 async def ascii_render(name, store=None):
-    gstore = GraphStore(ingest_dir, {})
+    gstore = GraphStore(ingest_dir, {}) if store is None else store
     key = next(iter(gstore.glob((None, None, "module", "papyri.examples"))))
 
     builtins.print(await _ascii_render(key, gstore))
 
 
-async def loc(document: Key, *, store: GraphStore, tree, known_refs, ref_map):
+async def loc(
+    document: Key, *, store: GraphStore, tree, known_refs, ref_map, backrefs=None
+):
     """
     return data for rendering in the templates
 
@@ -1109,6 +1160,9 @@ async def loc(document: Key, *, store: GraphStore, tree, known_refs, ref_map):
         point.
     ref_map: ??
         helper to compute the siblings for agiven hierarchy,
+    backrefs: Set[Key], optional
+        back references of the document, if already known (see
+        `GraphStore.get_backrefs_many`); queried from the store otherwise.
 
     Returns
     -------
@@ -1132,7 +1186,11 @@ async def loc(document: Key, *, store: GraphStore, tree, known_refs, ref_map):
     """
     assert isinstance(document, Key), type(document)
     qa = document.path
-    bytes_, backward, forward = store.get_all(document)
+    if backrefs is None:
+        bytes_, backward, forward = store.get_all(document)
+    else:
+        bytes_ = store.get_view(document)
+        backward, forward = backrefs, store.get_forwardrefs(document)
     doc_blob: IngestedBlobs = encoder.decode(bytes_)
 
     siblings = cs2(qa, tree, ref_map)
@@ -1160,7 +1218,15 @@ class StaticRenderingConfig:
     minify: bool
 
 
-async def main(ascii: bool, html, dry_run, sidebar: bool, graph: bool, minify: bool):
+async def main(
+    ascii: bool,
+    html,
+    dry_run,
+    sidebar: bool,
+    graph: bool,
+    minify: bool,
+    store: Optional[GraphStore] = None,
+):
     """
     This does static rendering of all the given files.
 
@@ -1175,7 +1241,8 @@ async def main(ascii: bool, html, dry_run, sidebar: bool, graph: bool, minify: b
     Sidebar:bool
         render the sidebar in html
     graph: bool
-
+    store: GraphStore, optional
+        store to render, instead of the one in ``config.ingest_dir``.
     """
 
     html_dir_: Optional[Path] = default_config.html_dir
@@ -1189,7 +1256,7 @@ async def main(ascii: bool, html, dry_run, sidebar: bool, graph: bool, minify: b
     config = StaticRenderingConfig(html, sidebar, ascii, output_dir, minify)
     prefix = "/p/"
 
-    gstore = GraphStore(ingest_dir, {})
+    gstore = GraphStore(ingest_dir, {}) if store is None else store
 
     known_refs, ref_map = find_all_refs(gstore)
     # end
@@ -59,13 +59,13 @@ from __future__ import annotations
 
 import sys
 from dataclasses import dataclass
-from typing import Any, List, NewType, Optional, Tuple, Union
+from typing import Any, Dict, List, MutableMapping, NewType, Optional, Tuple, Union
+from weakref import WeakValueDictionary
 
 import cbor2
 from there import print
 
-from .common_ast import Node, REV_TAG_MAP, register
-from .miniserde import get_type_hints
+from .common_ast import DECODERS, ENCODERS, Node, REV_TAG_MAP, TAG_MAP, register
 
 from .utils import dedent_but_first
 
@@ -86,7 +86,8 @@ class Verbatim(Node):
         return self.text == other.text
 
     def __hash__(self):
-        return hash(tuple(self.value))
+        # consistent with __eq__, which compares the text.
+        return hash(self.text)
 
     @property
     def text(self):
@@ -102,17 +103,6 @@ class Directive(Node):
     domain: Optional[str]
     role: Optional[str]
 
-    def __hash__(self):
-        return hash((tuple(self.value), self.domain, self.role))
-
-    def __eq__(self, other):
-        return (
-            (type(self) == type(other))
-            and (self.role == other.role)
-            and (other.domain == self.domain)
-            and (self.value == other.value)
-        )
-
     def __len__(self):
         return len(self.value) + len(self.prefix) + 2
 
@@ -163,9 +153,6 @@ class Link(Node):
     def __repr__(self):
         return f"<Link: {self.value=} {self.reference=} {self.kind=} {self.exists=}>"
 
-    def __hash__(self):
-        return hash((self.value, self.reference, self.kind, self.exists, self.anchor))
-
 
 class Leaf(Node):
     value: str
@@ -265,6 +252,9 @@ class RefInfo(Node):
 
     """
 
+    # weak references for the decoded instances, see `_decode_refinfo`.
+    __slots__ = ("module", "version", "kind", "path", "__weakref__")
+
     module: Optional[str]
     version: Optional[str]
     kind: str
@@ -275,6 +265,25 @@ class RefInfo(Node):
         return iter([self.module, self.version, self.kind, self.path])
 
 
+# The same RefInfo appear in many documents, and they are immutable; decoding
+# returns a single instance per distinct value instead of a new one each time.
+# Instances are only kept while in use, so that a long running server does
+# not accumulate the RefInfo of every document it decoded.
+_REFINFOS: MutableMapping[Tuple[Any, ...], RefInfo] = WeakValueDictionary()
+_decode_refinfo_values = DECODERS[TAG_MAP[RefInfo]]
+
+
+def _decode_refinfo(values):
+    key = tuple(values)
+    ref = _REFINFOS.get(key)
+    if ref is None:
+        ref = _REFINFOS[key] = _decode_refinfo_values(values)
+    return ref
+
+
+DECODERS[TAG_MAP[RefInfo]] = _decode_refinfo
+
+
 class Word(IntermediateNode):
     """
     This is a temporary node, while we visit the tree-sitter tree,
@@ -302,7 +311,8 @@ class Words(Node):
         return len(self.value)
 
     def __hash__(self):
-        return hash(self.value)
+        # consistent with __eq__, which ignores surrounding spaces.
+        return hash(self.value.strip())
 
 
 class _XList(Node):
@@ -397,9 +407,6 @@ class Section(Node):
     level: int = 0
     target: Optional[str] = None
 
-    def __eq__(self, other):
-        return super().__eq__(other)
-
     def __getitem__(self, k):
         return self.children[k]
 
@@ -528,16 +535,60 @@ class CodeLine(Node):
 
 @register(4020)
 class Code2(Node):
-    entries: List[Token]
+    """
+    A code example, with highlighting classes and links.
+
+    Instead of one node per token, the source is stored once, with a table of
+    spans over it.
+
+    Parameters
+    ----------
+    value : str
+        source of the example.
+    spans : list of int
+        flat table of ``(end, class, reference)`` triples, one per span, each
+        span starting where the previous one ends. ``class`` is an index in
+        ``classes``, and ``reference`` an index in ``references``, or -1 if the
+        span is not a link.
+    classes : list of str
+        pygments classes used for highlighting.
+    references : list of RefInfo
+        objects the spans link to.
+    out : str
+    ce_status : str
+
+    """
+
+    value: str
+    spans: List[int]
+    classes: List[str]
+    references: List[RefInfo]
     out: str
     ce_status: str
 
     @property
     def children(self):
-        return [*self.entries, self.out, self.ce_status]
+        return [*self.references, self.out, self.ce_status]
+
+    def tokens(self):
+        """
+        Iterate over the spans as ``(text, pygments class, RefInfo or None)``.
+        """
+        spans = self.spans
+        start = 0
+        for i in range(0, len(spans), 3):
+            end, class_, reference = spans[i : i + 3]
+            yield (
+                self.value[start:end],
+                self.classes[class_],
+                self.references[reference] if reference >= 0 else None,
+            )
+            start = end
 
     def __repr__(self):
-        return f"<{self.__class__.__name__}: {self.entries=} {self.out=} {self.ce_status=}>"
+        return (
+            f"<{self.__class__.__name__}: {self.value=} {self.out=} {self.ce_status=}>"
+        )
 
 
 class GenToken(Node):
@@ -648,12 +699,6 @@ class Paragraph(Node):
         ]
     ]
 
-    def __hash__(self):
-        return hash((tuple(self.children)))
-
-    def __eq__(self, other):
-        return (type(self) == type(other)) and (self.children == other.children)
-
 
 @register(4038)
 class Admonition(Node):
@@ -718,9 +763,6 @@ class BlockDirective(Node):
 class BlockVerbatim(Node):
     value: str
 
-    def __eq__(self, other):
-        return (type(self) == type(other)) and (self.value == other.value)
-
     def __repr__(self):
         return f"<{self.__class__.__name__} '{len(self.value)}'>"
 
@@ -813,7 +855,6 @@ class DefListItem(Node):
     @children.setter
     def children(self, value):
         self.dt, *self.dd = value
-        self.validate()
 
 
 @register(4028)
@@ -833,9 +874,6 @@ class SeeAlsoItem(Node):
     #    return cls(Ref(**name), descriptions, type)
     #    assert isinstance(self.descriptions, list)
 
-    def __hash__(self):
-        return hash((self.name, tuple(self.descriptions)))
-
     def __repr__(self):
         return (
             f"<{self.__class__.__name__}: {self.name} {self.type} {self.descriptions}>"
@@ -880,19 +918,55 @@ def parse_rst_section(text):
 class Encoder:
     def __init__(self, rev_map):
         self._rev_map = rev_map
+        # for each document being encoded (encode is reentrant), RefInfo
+        # already written -> their index as shared values.
+        self._shared: List[Dict[RefInfo, int]] = []
 
     def encode(self, obj):
-        return cbor2.dumps(obj, default=lambda encoder, obj: obj.cbor(encoder))
+        """
+        Encode ``obj`` to cbor.
+
+        The encoding is canonical, in particular keys of dicts are sorted, so
+        that equal objects are encoded to the same bytes whatever order they
+        were built in.
+        """
+        self._shared.append({})
+        try:
+            return cbor2.dumps(obj, default=self._default, canonical=True)
+        finally:
+            self._shared.pop()
+
+    def _encode_refinfo(self, encoder, ref):
+        """
+        Write the first occurrence of ``ref`` in a document as a shareable value
+        (cbor tag 28), and the following ones as references to it (tag 29).
+        """
+        shared = self._shared[-1]
+        index = shared.get(ref)
+        if index is None:
+            shared[ref] = len(shared)
+            encoder.encode_length(6, 28)
+            ENCODERS[RefInfo](encoder, ref)
+        else:
+            encoder.encode_length(6, 29)
+            encoder.encode_length(0, index)
+
+    def _default(self, encoder, obj):
+        if type(obj) is RefInfo:
+            return self._encode_refinfo(encoder, obj)
+        encode = ENCODERS.get(type(obj))
+        if encode is None:
+            return obj.cbor(encoder)
+        encode(encoder, obj)
 
     def _type_from_tag(self, tag):
         return self._rev_map[tag.tag]
 
     def _tag_hook(self, decoder, tag, shareable_index=None):
-        type_ = self._type_from_tag(tag)
-
-        tt = get_type_hints(type_)
-        kwds = {k: t for k, t in zip(tt, tag.value)}
-        return type_(**kwds)
+        decode = DECODERS.get(tag.tag)
+        if decode is None:
+            return self._type_from_tag(tag)._from_values(tag.value)
+        return decode(tag.value)
 
     def decode(self, bytes):
         return cbor2.loads(bytes, tag_hook=self._tag_hook)
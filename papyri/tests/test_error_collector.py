@@ -66,3 +66,21 @@ def test_4():
 
     with ec("TestItem"):
         ShouldValueErrorTypeError()
+
+
+def test_merge_state():
+    c = Config()
+    c.expected_errors = {"ValueError": ["A", "B"]}
+    c.early_error = False
+    c.fail_unseen_error = False
+    parent = ErrorCollector(c, log)
+    worker = ErrorCollector(c, log)
+
+    with worker("A"):
+        DoesValueError()
+    with worker("C"):
+        ShouldValueErrorTypeError()
+
+    parent.update(["A", "C"], *worker.state(["A", "C"]))
+    assert parent._errors == {"TypeError": ["C"]}
+    assert parent._expected_unseen == {"B": ["ValueError"]}
@@ -1,6 +1,7 @@
 from functools import lru_cache
 
-from papyri.gen import Config, Gen, NumpyDocString, BlockExecutor, APIObjectInfo
+from papyri.gen import Config, Gen, NumpyDocString, APIObjectInfo
+from papyri.miscs import BlockExecutor
 
 
 @lru_cache
@@ -34,6 +35,37 @@ def test_find_beyond_decorators():
     assert doc.item_file.endswith("test_gen.py")
 
 
+def ex_timeout():
+    """
+    Examples
+    --------
+    >>> a = 1
+
+    >>> while True: pass
+
+    >>> a
+    1
+    """
+
+
+def test_examples_after_timeout_not_executed():
+    config = Config(exec=True, infer=False, exec_timeout=1, exec_failure="fallback")
+    gen = Gen(dummy_progress=True, config=config)
+    # set when collecting.
+    gen.root, gen.version = "papyri", "0.0"
+
+    doc, figs = gen.prepare_doc_for_one_object(
+        ex_timeout,
+        NumpyDocString(ex_timeout.__doc__),
+        qa="irrelevant",
+        config=config,
+        aliases=[],
+        api_object=APIObjectInfo("function", ex_timeout.__doc__, None),
+    )
+    codes = [c for c in doc.example_section_data if type(c).__name__ == "Code"]
+    assert [c.ce_status for c in codes] == ["execed", "exception_in_exec", "compiled"]
+
+
 def test_infer():
     import scipy
     from scipy._lib._uarray._backend import Dispatchable
@@ -65,3 +97,140 @@ def test_infer():
     )
 
     assert list(res) == list(expected)
+
+
+def test_gen_cache(tmp_path):
+    import time
+    from papyri.gen import GenCache
+
+    def f():
+        "doc"
+
+    cache = GenCache(tmp_path, "context")
+    key = cache.key("mod.f", f, [])
+    assert cache.get(key) is None
+    cache.put(key, b"data", [("fig.png", b"png")])
+    assert cache.get(key) == (b"data", [("fig.png", b"png")])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    assert GenCache(tmp_path, "other").key("mod.f", f, []) != key
+    f.__doc__ = "changed"
+    assert cache.key("mod.f", f, []) != key
+
+    assert cache.prune(time.time() - 60) == 0
+    # entries of other contexts are left alone.
+    other = GenCache(tmp_path, "other")
+    other.put(key, b"other", [])
+    assert cache.prune(time.time() + 60) == 1
+    assert cache.get(key) is None
+    assert other.get(key) == (b"other", [])
+
+
+def test_gen_cache_key_has_source(tmp_path):
+    from papyri.gen import GenCache, _file_hash
+
+    source = tmp_path / "mod.py"
+    source.write_text("def f():\n    'doc'\n    return 1\n")
+    ns: dict = {}
+    exec(compile(source.read_text(), str(source), "exec"), ns)
+    cache = GenCache(tmp_path / "cache", "context")
+    key = cache.key("mod.f", ns["f"], [])
+    source.write_text("def f():\n    'doc'\n    return 2\n")
+    _file_hash.cache_clear()
+    assert cache.key("mod.f", ns["f"], []) != key
+
+
+def test_jedi_cache_evicts_least_recently_used(tmp_path):
+    from papyri.gen import JediCache
+
+    cache = JediCache(tmp_path / "jedi.db", 100)
+    keys = [JediCache.key(f"x = {i}", [], "1.0") for i in range(3)]
+    assert JediCache.key("x = 0", [], "2.0") != keys[0]
+    value = [[("x", "builtins.int"), (" = ", "")]]
+    cache.set(keys[0], value)
+    cache.set(keys[1], value)
+    assert cache.get(keys[0]) == value
+    # over the limit, the least recently used entry goes.
+    cache.set(keys[2], value)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == value
+    assert JediCache(tmp_path / "jedi.db", 100).get(keys[2]) == value
+
+    # replacing an entry does not count its previous size.
+    cache = JediCache(tmp_path / "jedi.db", 1000)
+    assert cache.get(keys[2]) == value
+    size = cache._size
+    cache.set(keys[2], value)
+    assert cache._size == size
+
+
+def test_script_inference_chunks():
+    from papyri.gen import ScriptInference
+
+    inference = ScriptInference({}, Config(infer=True))
+    inference.add("x = 1")
+    inference.add("x")
+    # the second chunk is inferred in the context of the first one.
+    assert inference.infer() == [
+        [("x", "builtins.int"), (" ", ""), ("=", ""), (" ", ""), ("1", "")],
+        [("x", "builtins.int")],
+    ]
+    # rebinding x starts a new group, so that the uses of x before it are
+    # not inferred from it.
+    inference.add("x = ''")
+    inference.add("x")
+    assert [group for *_, group in inference._chunks] == [0, 0, 1, 1]
+    assert [tokens[0] for tokens in inference.infer()] == [
+        ("x", "builtins.int"),
+        ("x", "builtins.int"),
+        ("x", "builtins.str"),
+        ("x", "builtins.str"),
+    ]
+
+
+def _names(ns):
+    return sorted(ns)
+
+
+def test_sandboxed_executor():
+    import pytest
+
+    from papyri.miscs import SandboxedExecutor
+
+    ns = {"a": 1}
+    executor = SandboxedExecutor(ns, timeout=1)
+    with executor:
+        assert executor.exec("b = a + 1") == (None, [], "", "")
+        assert executor.exec("print(b); b") == ("2", [], "2\n", "")
+        assert executor.call(_names) == ["__builtins__", "a", "b"]
+        with pytest.raises(ZeroDivisionError):
+            executor.exec("1 / 0")
+        with pytest.raises(TimeoutError):
+            executor.exec("while True: pass")
+        # a new process starts again from the namespace.
+        with pytest.raises(NameError):
+            executor.exec("b")
+        with pytest.raises(ChildProcessError):
+            executor.exec("import os; os._exit(1)")
+        executor.exec("b = 2")
+        executor._proc.kill()
+        executor._proc.join()
+        with pytest.raises(ChildProcessError):
+            executor.exec("b")
+        assert executor.exec("a") == ("1", [], "", "")
+    assert ns == {"a": 1}
+
+
+def test_sandboxed_executor_memory():
+    import pytest
+
+    from papyri.miscs import SandboxedExecutor
+
+    executor = SandboxedExecutor({}, timeout=10, memory=200 * 2**20)
+    with executor:
+        assert executor.exec("x = bytearray(100 * 2**20); len(x)")[0] == str(
+            100 * 2**20
+        )
+        with pytest.raises(MemoryError):
+            executor.exec("y = bytearray(300 * 2**20)")
+        assert executor.exec("len(x)")[0] == str(100 * 2**20)
@@ -0,0 +1,187 @@
+from papyri.graphstore import DecodedCache, GraphStore, Key
+
+
+def test_decoded_cache_evicts_least_recently_used():
+    c = DecodedCache(10)
+    c.get("a", lambda: ("A", 4))
+    c.get("b", lambda: ("B", 4))
+    assert c.get("a", lambda: ("wrong", 4)) == "A"
+    c.get("c", lambda: ("C", 4))
+
+    assert c.get("b", lambda: ("B2", 4)) == "B2"
+    assert c.info() == (1, 4, 10, 8)
+
+
+def test_decoded_cache_invalidate_and_too_large():
+    c = DecodedCache(10)
+    c.get("a", lambda: ("A", 4))
+    c.invalidate("a")
+    assert c.get("a", lambda: ("A2", 4)) == "A2"
+    assert c.get("big", lambda: ("BIG", 11)) == "BIG"
+    assert c.info().currsize == 4
+
+
+def test_memory_store_links_and_glob():
+    gs = GraphStore(None, storage="memory")
+    a = Key("pkg", "1.0", "module", "pkg.a")
+    b = Key("pkg", "1.0", "module", "pkg.b")
+    gs.put(a, b"A", [b])
+    gs.put(b, b"B", [Key("pkg", "*", "module", "pkg.a")])
+    # same package and identifier, but not the category of a.
+    gs.put(Key("pkg", "1.0", "docs", "c"), b"C", [Key("pkg", "*", "assets", "pkg.a")])
+
+    assert gs.get(a) == b"A"
+    assert gs.get_forwardrefs(a) == {b}
+    assert gs.get_backref(a) == {b}
+    assert gs.get_backref(b) == {a}
+    assert sorted(gs.glob((None, None, "module", None))) == [a, b]
+    assert gs.glob(("pkg", None)) == [("pkg", "1.0")]
+    assert gs.glob(("other", None, None, None)) == []
+
+    gs.remove(a)
+    assert gs.glob((None, None, "module", None)) == [b]
+    assert gs.get_backref(b) == set()
+
+
+def test_store_database_lives_in_root(tmp_path):
+    gs = GraphStore(tmp_path / "ingest")
+    key = Key("pkg", "1.0", "module", "pkg.a")
+    gs.put(key, b"A", [])
+    gs.close()
+
+    assert (tmp_path / "ingest" / "papyri.db").exists()
+    assert GraphStore(tmp_path / "ingest").glob((None, None, None, None)) == [key]
+
+
+def test_put_same_bytes_is_noop(tmp_path):
+    gs = GraphStore(tmp_path)
+    a = Key("pkg", "1.0", "module", "pkg.a")
+    b = Key("pkg", "1.0", "module", "pkg.b")
+    assert gs.get_hash(a) is None
+    gs.put(a, b"A", [b])
+    digest = gs.get_hash(a)
+    assert digest is not None
+
+    # the links are not updated, as they are derived from the same bytes.
+    gs.put(a, b"A", [])
+    assert gs.get_hash(a) == digest
+    assert gs.get_forwardrefs(a) == {b}
+
+    with gs.batch():
+        gs.put(a, b"A", [])
+        gs.put(b, b"B", [])
+    assert gs.get_forwardrefs(a) == {b}
+    with gs.batch():
+        gs.put(a, b"A2", [])
+    assert gs.get_hash(a) not in (None, digest)
+    assert gs.get_forwardrefs(a) == set()
+
+
+def test_pack_store_compact_in_new_process(tmp_path):
+    gs = GraphStore(tmp_path, storage="pack")
+    a = Key("pkg", "1.0", "module", "pkg.a")
+    b = Key("pkg", "1.0", "module", "pkg.b")
+    store = gs._blobs
+    store.put(a, b"A" * 10)
+    store.put(b, b"B" * 100)
+    store.put(b, b"B" * 100)
+    store.put(b, b"C" * 100)
+    gs.conn.commit()
+    gs.close()
+
+    # no segment is open for writing, as if in a new process.
+    store = GraphStore(tmp_path, storage="pack")._blobs
+    assert store.compact() == 200
+    assert store.get(a) == b"A" * 10
+    assert store.get(b) == b"C" * 100
+    assert store.glob((None, None, None, None)) == [a, b]
+    packs = tmp_path / "packs" / "pkg" / "1.0"
+    assert [p.name for p in packs.glob("*.pack")] == ["00001.pack"]
+
+
+def test_pack_store_read_during_compaction(tmp_path):
+    gs = GraphStore(tmp_path, storage="pack")
+    writer = gs._blobs
+    a = Key("pkg", "1.0", "module", "pkg.a")
+    writer.put(a, b"A" * 100)
+    writer.put(a, b"B" * 10)
+    gs.conn.commit()
+
+    # the segment of a is compacted away between the lookup and the read.
+    reader = GraphStore(tmp_path, storage="pack")._blobs
+    locate = reader._locate
+
+    def racing_locate(key):
+        location = locate(key)
+        if location[0] == 0:
+            writer.compact()
+        return location
+
+    reader._locate = racing_locate  # type: ignore
+    assert reader.get(a) == b"B" * 10
+    assert not (tmp_path / "packs" / "pkg" / "1.0" / "00000.pack").exists()
+
+
+def test_decoded_cache_sees_other_writers(tmp_path):
+    reader = GraphStore(tmp_path)
+    writer = GraphStore(tmp_path)
+    a = Key("pkg", "1.0", "module", "pkg.a")
+    writer.put(a, b"A", [])
+    assert reader.get_decoded(a, bytes) == b"A"
+    assert reader.get_decoded(a, bytes) == b"A"
+    # put by another store, which does not invalidate the cache of reader.
+    writer.put(a, b"A2", [])
+    assert reader.get_decoded(a, bytes) == b"A2"
+    assert reader.cache_info().hits == 1
+
+    # put before hashes were recorded: not cached, and hashed for next time.
+    writer.conn.execute("update documents set hash=null")
+    writer.conn.commit()
+    assert reader.get_decoded(a, bytes) == b"A2"
+    assert reader.cache_info().misses == 2
+    assert reader.get_hash(a) is not None
+    assert reader.get_decoded(a, bytes) == b"A2"
+    assert reader.cache_info().hits == 2
+
+
+def test_failed_batch_rolls_back_removals(tmp_path):
+    import pytest
+
+    gs = GraphStore(tmp_path)
+    a = Key("pkg", "1.0", "module", "pkg.a")
+    b = Key("pkg", "1.0", "module", "pkg.b")
+    gs.put(a, b"A", [b])
+    with pytest.raises(RuntimeError):
+        with gs.batch():
+            gs.put(b, b"B", [a])
+            gs._remove_source(a)
+            raise RuntimeError
+    # nothing from the batch was committed.
+    assert gs.get_forwardrefs(a) == {b}
+    assert gs.get_backref(a) == set()
+
+
+def test_generation_counts_writes(tmp_path):
+    import sqlite3
+
+    gs = GraphStore(tmp_path)
+    a = Key("pkg", "1.0", "module", "pkg.a")
+    assert gs.generation() == 0
+    gs.put(a, b"A", [])
+    generation = gs.generation()
+    assert generation > 0
+    with gs.batch():
+        gs.put(a, b"A2", [])
+        gs.put(Key("pkg", "1.0", "module", "pkg.b"), b"B", [a])
+    # one transaction for the batch.
+    assert gs.generation() == generation + 1
+    gs.close()
+
+    # a database of schema version 2 gets the table when opened.
+    conn = sqlite3.connect(tmp_path / "papyri.db")
+    conn.execute("DROP TABLE generation")
+    conn.execute("PRAGMA user_version = 2")
+    conn.close()
+    gs = GraphStore(tmp_path)
+    assert gs.generation() == 0
+    assert gs.get_forwardrefs(Key("pkg", "1.0", "module", "pkg.b")) == {a}
@@ -39,3 +39,10 @@ def test_parse_reference():
     [text, reference] = paragraph.children
     assert reference.value == "reference <to this>"
     assert text.value == "This is a "
+
+
+def test_parse_text_runs():
+    [section] = parse("Some words\nover two lines [1]_".encode())
+    [paragraph] = section.children
+    [text] = paragraph.children
+    assert text.value == "Some words over two lines"
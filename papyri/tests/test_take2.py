@@ -1,10 +1,17 @@
+import pickle
+
 import pytest
 
 from papyri.ts import parse
 
-from ..myst_ast import MMystDirective
+from ..myst_ast import MMystDirective, MParagraph, MText
 from ..take2 import (
+    BlockDirective,
+    Link,
+    RefInfo,
+    Section,
     dedent_but_first,
+    encoder,
     get_object,
 )
 
@@ -20,3 +27,136 @@ def test_parse_blocks(target, type_, number):
     sections = parse(dedent_but_first(get_object(target).__doc__).encode())
     filtered = [b for section in sections for b in section.children if type(b) == type_]
     assert len(filtered) == number
+
+
+def test_encode_decode_roundtrip():
+    block = BlockDirective("note", "", [["k", "v"]], "content")
+    decoded = encoder.decode(encoder.encode([MText("hi"), block]))
+    assert decoded == [MText("hi"), block]
+    # _post_deserialise is still called when decoding.
+    assert decoded[1].options == [("k", "v")]
+
+
+def test_slotted_nodes():
+    ref = RefInfo("numpy", "1.0", "module", "numpy.sin")
+    link = Link("sin", ref, "module", True)
+    assert not hasattr(link, "__dict__")
+    assert not hasattr(ref, "__dict__")
+    # annotated class attributes are defaults, not class attributes.
+    assert link.anchor is None
+    assert "anchor" in Link.__slots__
+    with pytest.raises(AttributeError):
+        link.other = 1
+    assert pickle.loads(pickle.dumps(link)) == link
+
+
+def test_structural_hash():
+    def section(text):
+        return Section([MParagraph([MText(text), MText("!")])], None)
+
+    a, b, c = section("hi"), section("hi"), section("ho")
+    assert a == b and hash(a) == hash(b) and {a, b} == {a}
+    assert a != c
+    # the hash follows the changes.
+    b.children[0].children[0].value = "ho"
+    assert hash(b) == hash(c) and b == c
+
+
+def test_validate():
+    from ..common_ast import should_validate
+
+    ref = RefInfo("numpy", "1.0", "module", "numpy.sin")
+    Section([MParagraph([MText("hi")])], None).validate()
+    with pytest.raises(ValueError, match="children.0.children.0.value field"):
+        Section([MParagraph([MText(None)])], None).validate()
+    with pytest.raises(ValueError, match="reference field"):
+        Link("sin", "numpy.sin", "module", True).validate()
+    Link("sin", ref, "module", True).validate()
+
+    names = [f"numpy.f{i}" for i in range(100)]
+    sampled = [n for n in names if should_validate("sample", n)]
+    assert 0 < len(sampled) < 50
+    assert sampled == [n for n in names if should_validate("sample", n)]
+    assert all(should_validate("full", n) for n in names)
+    assert not any(should_validate("off", n) for n in names)
+
+    from ..crosslink import Ingester
+
+    with pytest.raises(ValueError, match="'sample', 'full'"):
+        Ingester(dp=True, validation_level="ful")
+
+
+def test_lazy_ingested_blob():
+    from ..crosslink import IngestedBlobs, LazyIngestedBlob
+
+    blob = IngestedBlobs.new()
+    blob.content = {
+        "Summary": Section([MParagraph([MText("short")])], "Summary"),
+        "Notes": Section([MParagraph([MText("long " * 100)])], "Notes"),
+    }
+    blob.example_section_data = Section([], None)
+    blob.arbitrary = []
+    blob.see_also = []
+    blob.qa = "pkg.thing"
+    data = encoder.encode(blob)
+
+    lazy = encoder.decode(data)
+    assert isinstance(lazy, LazyIngestedBlob)
+    # small fields are inline, large sections are only decoded when used.
+    assert set(lazy._raw) == set()
+    assert isinstance(lazy.content._data["Notes"], bytes)
+    assert lazy.content["Notes"] == blob.content["Notes"]
+    assert lazy == blob
+    assert encoder.encode(lazy) == data
+
+
+def test_code_spans():
+    from ..take2 import Code, GenToken
+    from ..tree import DVR
+
+    ref = RefInfo("numpy", "1.0", "module", "numpy.linspace")
+    dv = DVR(
+        "numpy", frozenset({ref}), local_refs=frozenset(), aliases={}, version="1.0"
+    )
+    code = Code(
+        [
+            GenToken("np", None, ""),
+            GenToken(".", None, "o"),
+            GenToken("linspace", "numpy.linspace", "n"),
+            GenToken("(", None, ""),
+            GenToken("[", None, ""),
+            GenToken("\n", None, ""),
+            GenToken("1", None, "mi"),
+        ],
+        "",
+        "compiled",
+    )
+    [code2] = dv.replace_Code(code)
+    assert code2.value == "np.linspace([\n1"
+    assert list(code2.tokens()) == [
+        ("np", "", None),
+        (".", "o", None),
+        ("linspace", "n", ref),
+        ("([", "", None),
+        ("\n", "", None),
+        ("1", "mi", None),
+    ]
+    assert encoder.decode(encoder.encode(code2)) == code2
+
+
+def test_shared_refinfo():
+    ref = RefInfo("numpy", "1.0", "module", "numpy.sin")
+    links = [Link("sin", RefInfo(*ref), "module", True) for _ in range(3)]
+    data = encoder.encode(links)
+    # written once, then as references to the first occurrence.
+    assert data.count(b"numpy.sin") == 1
+    decoded = encoder.decode(data)
+    assert decoded == links
+    # and decoded to a single instance, shared with other documents.
+    assert decoded[0].reference is decoded[2].reference
+    assert encoder.decode(encoder.encode(ref)) is decoded[0].reference
+    # as long as they are used.
+    from ..take2 import _REFINFOS
+
+    del decoded
+    assert tuple(ref) not in _REFINFOS
@@ -26,7 +26,6 @@ from .take2 import (
     Paragraph,
     RefInfo,
     SubstitutionDef,
-    Token,
     Verbatim,
 )
 from .common_ast import Node
@@ -533,56 +532,61 @@ class DirectiveVisiter(TreeReplacer):
 
     def replace_Code(self, code):
         """
-        Here we'll crawl example data and convert code entries so that each token contain a link to the object they
-        refered to.
+        Here we'll crawl example data and convert code entries to a `Code2`, where
+        tokens are spans over the source, linked to the object they refer to.
+
+        Consecutive tokens with the same class and no link are merged in a single
+        span; newlines get their own span as renderers insert prompts there.
         """
         # TODO: here we'll have a problem as we will love the content of entry[1]. This should really be resolved at gen
         # time.
         # print("CODE 1 in", self.qa)
-        new_entries = []
+        texts = []
+        spans: List[int] = []
+        classes: Dict[str, int] = {}
+        references: Dict[RefInfo, int] = {}
+        end = 0
+        prev_text = ""
         for gt in code.entries:
             text, infer, type_ = gt.value, gt.qa, gt.pygmentclass
             assert isinstance(text, str)
+            reference = -1
             # TODO
             if infer and infer.strip():
                 assert isinstance(infer, str)
                 r = self._resolve(frozenset(), infer)
                 if r.kind == "module":
                     self._targets.add(r)
-                    new_entries.append(
-                        Token(
-                            Link(
-                                text,
-                                r,
-                                "module",
-                                True,
-                            ),
-                            type_,
-                        )
-                    )
-                    continue
                 elif r.module is None:
                     mod = infer.split(".", maxsplit=1)[0]
-                    new_entries.append(
-                        Token(
-                            Link(
-                                text,
-                                RefInfo(mod, "*", "module", infer),
-                                "module",
-                                True,
-                            ),
-                            type_,
-                        )
-                    )
+                    r = RefInfo(mod, "*", "module", infer)
                 else:
                     assert False
-                continue
-
-            new_entries.append(
-                Token(text, type_),
+                reference = references.setdefault(r, len(references))
+            class_ = classes.setdefault(type_, len(classes))
+            end += len(text)
+            texts.append(text)
+            if (
+                reference == -1
+                and spans[-1:] == [-1]
+                and spans[-2] == class_
+                and "\n" not in (text, prev_text)
+            ):
+                spans[-3] = end
+            else:
+                spans += [end, class_, reference]
+            prev_text = text
+
+        return [
+            Code2(
+                "".join(texts),
+                spans,
+                list(classes),
+                list(references),
+                code.out,
+                code.ce_status,
             )
-
-        return [Code2(new_entries, code.out, code.ce_status)]
+        ]
 
     def _block_verbatim_helper(self, name: str, argument: str, options: dict, content):
         data = f".. {name}:: {argument}\n"
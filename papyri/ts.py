@@ -146,6 +146,8 @@ class Node:
 
 
 class Whitespace(Node):
+    __slots__ = ("_start_byte", "_end_byte", "_end_point", "_start_point")
+
     def __init__(self, byte_start, byte_end, start_point, end_point):
         self._start_byte = byte_start
         self._end_byte = byte_end
@@ -254,6 +256,20 @@ class TSVisitor:
 
         return nacc
 
+    def _flush_run(self, run, acc):
+        """
+        Append a run of text pieces to acc as a single MText.
+
+        A trailing whitespace piece is kept as its own node, so that
+        visit_paragraph can still drop the space left before the end of a
+        paragraph.
+        """
+        if len(run) > 1 and run[-1].isspace():
+            acc.append(MText("".join(run[:-1])))
+            acc.append(MText(run[-1]))
+        else:
+            acc.append(MText("".join(run)))
+
     def visit(self, node):
         self.depth += 1
         acc = []
@@ -262,17 +278,35 @@ class TSVisitor:
         if node.type == "ERROR":
             # print(f'ERROR node: {self.as_text(c)!r}, skipping')
             return []
+        # Consecutive text and whitespace tokens are collected here and
+        # emitted as a single MText instead of one node per word.
+        run: List[str] = []
         for c in node.children:
             kind = c.type
+            if kind in ("text", "standalone_hyperlink"):
+                run.append(self.bytes[c.start_byte : c.end_byte].decode())
+                prev_end = c.end_point
+                continue
+            if kind == "whitespace":
+                content = self.bytes[c.start_byte : c.end_byte].decode()
+                run.append(" " * len(content))
+                prev_end = c.end_point
+                continue
             if kind == "::":
-                if acc and isinstance(acc[-1], Word):
+                # a pending run means the previous node is an MText.
+                if run:
+                    pass
+                elif acc and isinstance(acc[-1], Word):
                     word = acc.pop()
                     acc.append(MText(word.value + ":"))
                 elif acc and isinstance(acc[-1], inline_nodes):
-                    acc.append(MText(":"))
+                    run.append(":")
                 # else:
                 #    assert False
                 continue
+            if run:
+                self._flush_run(run, acc)
+                run = []
             if not hasattr(self, "visit_" + kind):
                 raise ValueError(
                     f"visit_{kind} not found while visiting {node}::\n{self.as_text(c)!r}"
@@ -281,6 +315,8 @@ class TSVisitor:
             new_children = meth(c, prev_end=prev_end)
             acc.extend(new_children)
             prev_end = c.end_point
+        if run:
+            self._flush_run(run, acc)
         self.depth -= 1
         acc = self._compressor(acc)
         acc = self._targetify(acc)
@@ -368,8 +404,6 @@ class TSVisitor:
     def visit_text(self, node, prev_end=None):
         # t = Word(self.bytes[node.start_byte: node.end_byte].decode())
         t = MText(self.bytes[node.start_byte : node.end_byte].decode())
-        t.start_byte = node.start_byte
-        t.end_byte = node.end_byte
         # print(' '*self.depth*4, t, node.start_byte, node.end_byte)
         return [t]
 
@@ -378,8 +412,6 @@ class TSVisitor:
         # assert set(content) == {' '}, repr(content)
         # t = Word(" " * len(content))
         t = MText(" " * len(content))
-        t.start_byte = node.start_byte
-        t.end_byte = node.end_byte
         # print(' '*self.depth*4, t, node.start_byte, node.end_byte)
         return [t]
 
@@ -1,7 +1,8 @@
 import time
+from bisect import bisect_left
 from datetime import timedelta
 from textwrap import dedent
-from typing import Tuple
+from typing import List, Tuple
 
 from rich.progress import BarColumn, Progress, ProgressColumn, Task, TextColumn
 from rich.text import Text
@@ -152,3 +153,24 @@ def pos_to_nl(script: str, pos: int) -> Tuple[int, int]:
         else:
             return ln, rest
     raise RuntimeError
+
+
+class LinePositions:
+    """
+    Convert many pigments positions in the same script to Jedi col/line, like
+    `pos_to_nl`, without scanning the script from the start for each of them.
+    """
+
+    def __init__(self, script: str):
+        # offset of the end of each line.
+        self._ends: List[int] = []
+        end = -1
+        for line in script.splitlines():
+            end += len(line) + 1
+            self._ends.append(end)
+
+    def __call__(self, pos: int) -> Tuple[int, int]:
+        ln = bisect_left(self._ends, pos)
+        if ln == len(self._ends):
+            raise RuntimeError
+        return ln, pos - (self._ends[ln - 1] + 1 if ln else 0)